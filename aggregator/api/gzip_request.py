@@ -0,0 +1,42 @@
+import io
+import zlib
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+
+class GzipRequestMiddleware:
+    """
+    WSGI middleware that transparently decompresses request bodies sent with
+    `Content-Encoding: gzip`, so routes keep reading them with request.get_json().
+
+    The decompressed size is capped at max_size bytes to guard against compression bombs.
+    """
+
+    def __init__(self, wsgi_app, max_size):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_CONTENT_ENCODING', '').strip().lower() == 'gzip':
+            try:
+                body = self._decompress(environ)
+            except (BadRequest, RequestEntityTooLarge) as e:
+                return e(environ, start_response)
+            environ['wsgi.input'] = io.BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+            del environ['HTTP_CONTENT_ENCODING']
+        return self.wsgi_app(environ, start_response)
+
+    def _decompress(self, environ):
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise BadRequest("Invalid Content-Length")
+        compressed = environ['wsgi.input'].read(length) if length else environ['wsgi.input'].read()
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(compressed, self.max_size + 1)
+        except zlib.error:
+            raise BadRequest("Invalid gzip request body")
+        if len(body) > self.max_size:
+            raise RequestEntityTooLarge(f"Decompressed request body exceeds {self.max_size} bytes")
+        return body
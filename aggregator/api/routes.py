@@ -1,11 +1,21 @@
+import time
 import uuid
-from flask import Blueprint, request, jsonify, render_template, current_app
-from aggregator.models import db, Device
-from aggregator.services.metrics_service import process_metrics
-from aggregator.services.metrics_query_service import get_latest_metrics
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, render_template, current_app, stream_with_context
+from aggregator.models import db, Device, Metric, MetricField
+from aggregator.services.metrics_service import Envelope, ingest_envelopes
 from aggregator.services.history_service import get_metric_history
-from aggregator.services.schema_service import get_schema
-from aggregator.services.command_service import send_device_command, get_pending_commands
+from aggregator.services.range_service import get_metric_range, parse_aggregates, parse_bucket, parse_time
+from aggregator.services.snapshot_service import latest_changes, latest_snapshot, schema_snapshot
+from aggregator.services.command_service import (
+    broadcast_command,
+    get_pending_commands,
+    send_device_command,
+    wait_for_commands,
+)
+from aggregator.services.definition_cache import get_device_ref, invalidate_device
+from aggregator.services.ingest_queue import IngestQueueFull
+from aggregator.services.stream_broker import TooManySubscribers, metrics_broker
 
 api_bp = Blueprint('api_bp', __name__)
 
@@ -13,68 +23,313 @@ api_bp = Blueprint('api_bp', __name__)
 def index():
     return render_template('dashboard.html')
 
+def _metrics_error(metrics_list):
+    """
+    Check the shape of an envelope's metrics, which ingest relies on: a list of objects whose
+    'name' is a string and whose 'fields' is an object. Returns an error message or None.
+    """
+    if not isinstance(metrics_list, list):
+        return "metrics must be a list"
+    for metric_data in metrics_list:
+        if not isinstance(metric_data, dict):
+            return "Each metric must be an object"
+        name = metric_data.get('name')
+        if name is not None and (not isinstance(name, str) or len(name) > Metric.name.type.length):
+            return f"Metric name must be a string of at most {Metric.name.type.length} characters"
+        fields = metric_data.get('fields')
+        if fields is not None and not isinstance(fields, dict):
+            return f"fields of metric '{name}' must be an object"
+        if fields and any(len(field_name) > MetricField.field_name.type.length for field_name in fields):
+            return f"Field names must be at most {MetricField.field_name.type.length} characters"
+    return None
+
+def _parse_envelope(item, idempotency_key=None):
+    """
+    Validate one ingest envelope; idempotency_key is used when the envelope has none.
+    Returns (Envelope, None) or (None, (error message, status code)).
+    """
+    if not isinstance(item, dict):
+        return None, ("Envelope must be an object", 400)
+    device_guid = item.get('device_guid')
+    metrics_list = item.get('metrics')
+    if not device_guid or not metrics_list:
+        return None, ("device_guid and metrics are required", 400)
+    metrics_error = _metrics_error(metrics_list)
+    if metrics_error:
+        return None, (metrics_error, 400)
+    timestamp = None
+    if item.get('timestamp') is not None:
+        try:
+            timestamp = parse_time(item['timestamp'])
+        except ValueError as e:
+            return None, (str(e), 400)
+        max_skew = current_app.config.get('MAX_CLOCK_SKEW_SECONDS', 300)
+        if timestamp > datetime.utcnow() + timedelta(seconds=max_skew):
+            return None, (f"timestamp is more than {max_skew} seconds in the future", 400)
+    idempotency_key = item.get('idempotency_key') or idempotency_key
+    if idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) > 64):
+        return None, ("idempotency_key must be a string of at most 64 characters", 400)
+    device = get_device_ref(device_guid)
+    if not device:
+        return None, ("Device not registered", 404)
+    return Envelope(device, metrics_list, timestamp, idempotency_key), None
+
+def _queue_full_response(ingest_queue, body):
+    response = jsonify(body)
+    response.headers['Retry-After'] = str(max(1, round(ingest_queue.flush_interval)))
+    return response, 429
+
 @api_bp.route('/api/metrics', methods=['GET', 'POST'])
 def metrics():
     """
     GET: Return the latest reading for each metric.
+    With 'since' (the 'cursor' of a previous response, 0 for a first call) only metrics whose
+    latest reading changed are returned, as {'metrics': [...], 'cursor': <next since>}.
+    The cursor trails the newest readings by METRICS_CURSOR_SETTLE_SECONDS, so a metric may
+    be returned again by the next call; apply changes by metric_id and timestamp.
     POST: Receives metrics from a collector.
-    Expects JSON with 'device_guid' and 'metrics' (a list of metric objects).
+    Expects JSON with 'device_guid' and 'metrics' (a list of metric objects), and optionally
+    the collection 'timestamp' (ISO 8601 or epoch seconds, at most MAX_CLOCK_SKEW_SECONDS
+    ahead of the server) and an 'idempotency_key' (also accepted as an Idempotency-Key
+    header). Re-sent payloads are only stored once.
+    In write-behind mode the payload is queued and 202 returned, or 429 if the queue is full.
     """
     if request.method == 'GET':
-        metrics_data = get_latest_metrics()
-        return jsonify(metrics_data)
+        # Served from a short-lived snapshot shared by every caller
+        since = request.args.get('since')
+        if since is None:
+            metrics_data = latest_snapshot.get()
+            return jsonify(metrics_data)
+        if not since.isdigit():
+            return jsonify({"error": "since must be a non-negative integer cursor"}), 400
+        changed, cursor = latest_changes(int(since))
+        return jsonify({"metrics": changed, "cursor": cursor})
     elif request.method == 'POST':
         api_key = request.headers.get('X-API-Key')
         if api_key != current_app.config.get('API_KEY'):
             return jsonify({"error": "Unauthorized"}), 401
 
-        data = request.get_json()
-        device_guid = data.get('device_guid')
-        metrics_list = data.get('metrics')
+        envelope, err = _parse_envelope(request.get_json(silent=True), request.headers.get('Idempotency-Key'))
+        if err:
+            return jsonify({"error": err[0]}), err[1]
+
+        ingest_queue = current_app.extensions.get('ingest_queue')
+        if ingest_queue is not None:
+            try:
+                ingest_queue.put(envelope)
+            except IngestQueueFull as e:
+                return _queue_full_response(ingest_queue, {"error": str(e)})
+            return jsonify({"status": "queued"}), 202
+
+        stats = ingest_envelopes([envelope])
+        status = "duplicate" if stats['duplicate_envelopes'] else "ok"
+        return jsonify({"status": status, "ingest": stats}), 200
+
+@api_bp.route('/api/metrics/batch', methods=['POST'])
+def metrics_batch():
+    """
+    Receives metrics for many devices and time points in one request.
+    Expects a JSON array of {'device_guid', 'metrics', 'timestamp', 'idempotency_key'}
+    envelopes, where timestamp (ISO 8601 or epoch seconds, at most MAX_CLOCK_SKEW_SECONDS
+    ahead of the server) and idempotency_key are optional.
+    Valid envelopes are stored in a single transaction (or queued, in write-behind mode);
+    invalid ones are reported and skipped.
+    Returns a status for every envelope, in request order.
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key != current_app.config.get('API_KEY'):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "A non-empty array of envelopes is required"}), 400
+    max_envelopes = current_app.config.get('MAX_BATCH_ENVELOPES')
+    if len(data) > max_envelopes:
+        return jsonify({"error": f"At most {max_envelopes} envelopes are accepted per request"}), 413
 
-        if not device_guid or not metrics_list:
-            return jsonify({"error": "device_guid and metrics are required"}), 400
+    results = []
+    accepted = []
+    for index, item in enumerate(data):
+        envelope, err = _parse_envelope(item)
+        result = {"index": index, "device_guid": item.get('device_guid') if isinstance(item, dict) else None}
+        if err:
+            result.update(status="error", error=err[0], code=err[1])
+        else:
+            accepted.append((result, envelope))
+        results.append(result)
 
-        device = Device.query.filter_by(guid=device_guid).first()
-        if not device:
-            return jsonify({'error': 'Device not registered'}), 404
+    ingest_queue = current_app.extensions.get('ingest_queue')
+    if ingest_queue is not None:
+        queued = 0
+        for result, envelope in accepted:
+            try:
+                ingest_queue.put(envelope)
+            except IngestQueueFull as e:
+                result.update(status="error", error=str(e), code=429)
+                continue
+            result.update(status="queued")
+            queued += 1
+        if accepted and not queued:
+            return _queue_full_response(ingest_queue, {"status": "rejected", "results": results})
+        return jsonify({"status": "queued", "results": results}), 202
 
-        process_metrics(device, metrics_list)
-        return jsonify({"status": "ok"}), 200
+    stats = ingest_envelopes([envelope for _, envelope in accepted]) if accepted else None
+    duplicates = set(stats['duplicate_envelopes']) if stats else set()
+    for position, (result, _) in enumerate(accepted):
+        result.update(status="duplicate" if position in duplicates else "ok")
+    return jsonify({"status": "ok", "ingest": stats, "results": results}), 200
+
+@api_bp.route('/api/ingest/status', methods=['GET'])
+def ingest_status():
+    """
+    Return the ingest mode, live stream subscriber counts and, in write-behind mode, queue
+    depth and batch latency.
+    """
+    ingest_queue = current_app.extensions.get('ingest_queue')
+    if ingest_queue is None:
+        return jsonify({"mode": "sync", "stream": metrics_broker.stats()})
+    return jsonify({"mode": "write-behind", "queue": ingest_queue.stats(), "stream": metrics_broker.stats()})
+
+def _csv_arg(name, type=str):
+    """Return the set of comma separated values of a query parameter (repeatable)."""
+    values = set()
+    for raw in request.args.getlist(name):
+        for value in raw.split(','):
+            if value.strip():
+                values.add(type(value.strip()))
+    return values
+
+def _metrics_stream(subscription, heartbeat, max_seconds):
+    """Yield Server-Sent Events for a subscription until it is dropped or max_seconds pass."""
+    try:
+        # Ask EventSource clients to reconnect after 3 s when the stream ends
+        yield "retry: 3000\n\n"
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            frames = subscription.get(timeout=heartbeat)
+            if frames:
+                yield "".join(frames)
+            elif subscription.dropped:
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            else:
+                # Comment line: keeps proxies from timing out an idle connection
+                yield ": heartbeat\n\n"
+    finally:
+        metrics_broker.unsubscribe(subscription)
+
+@api_bp.route('/api/stream/metrics', methods=['GET'])
+def stream_metrics():
+    """
+    Stream readings as they are ingested, as Server-Sent Events.
+    Each message carries one reading shaped like an item of GET /api/metrics plus its
+    'reading_id' (also the event id). Optional filters, comma separated or repeated:
+    device (friendly name), metric (name) and metric_id.
+    A heartbeat comment is sent when nothing happened for a while. A client that falls too
+    far behind receives a 'dropped' event and is disconnected; it should reload
+    /api/metrics and reconnect.
+
+    Only readings ingested by the worker process serving the stream are pushed, so clients
+    should also poll GET /api/metrics?since=<cursor> as a backstop. Each stream holds a
+    request thread for up to STREAM_MAX_SECONDS; beyond STREAM_MAX_SUBSCRIBERS open streams
+    the request is refused with 503.
+    """
+    try:
+        metric_ids = _csv_arg('metric_id', int)
+    except ValueError:
+        return jsonify({"error": "metric_id must be an integer"}), 400
+    try:
+        subscription = metrics_broker.subscribe(_csv_arg('device'), _csv_arg('metric'), metric_ids)
+    except TooManySubscribers as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    stream = _metrics_stream(
+        subscription,
+        current_app.config.get('STREAM_HEARTBEAT_SECONDS'),
+        current_app.config.get('STREAM_MAX_SECONDS')
+    )
+    response = Response(stream_with_context(stream), mimetype='text/event-stream')
+    # Also covers clients that disconnect before the stream is first iterated
+    response.call_on_close(lambda: metrics_broker.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @api_bp.route('/api/history/<int:metric_id>', methods=['GET'])
 def history(metric_id):
     """
     Return historical readings for a given metric with pagination.
+    Pass the 'next_cursor' of a response as 'before' to fetch the next page by keyset,
+    and include_total=false to skip counting the metric's readings.
     """
-    page = request.args.get('page', 1, type=int)
-    page_size = request.args.get('page_size', 20, type=int)
-    history_data = get_metric_history(metric_id, page, page_size)
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = max(request.args.get('page_size', 20, type=int), 1)
+    before = request.args.get('before')
+    include_total = request.args.get('include_total', 'true').lower() not in ('false', '0', 'no')
+    try:
+        history_data = get_metric_history(metric_id, page, page_size, before=before, include_total=include_total)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify(history_data)
 
+@api_bp.route('/api/history/<int:metric_id>/range', methods=['GET'])
+def history_range(metric_id):
+    """
+    Return the numeric fields of a metric aggregated into time buckets.
+    Query parameters: start, end (ISO 8601 or epoch seconds), bucket (e.g. 1m) and
+    agg (comma separated list of avg, min, max, count, last).
+    """
+    try:
+        start = parse_time(request.args['start']) if request.args.get('start') else None
+        end = parse_time(request.args['end']) if request.args.get('end') else None
+        bucket_seconds = parse_bucket(request.args.get('bucket', '1m'))
+        aggregates = parse_aggregates(request.args.get('agg', 'avg'))
+        range_data = get_metric_range(metric_id, start, end, bucket_seconds, aggregates)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(range_data)
+
 @api_bp.route('/api/command', methods=['POST'])
 def send_command():
     """
     Endpoint to send a command to a device.
-    Expects JSON with keys 'device' and 'command'.
+    Expects JSON with keys 'device' and 'command', or 'device_type' and 'command' to send
+    the command to every device of that type.
     """
     data = request.get_json()
     device_friendly = data.get('device')
+    device_type = data.get('device_type')
     command_text = data.get('command')
-    if not device_friendly or not command_text:
+    if not (device_friendly or device_type) or not command_text:
         return jsonify({"error": "Device and command are required"}), 400
-    command, err = send_device_command(device_friendly, command_text)
+    if device_type and not device_friendly:
+        queued, err = broadcast_command(device_type, command_text)
+        if err:
+            return jsonify({"error": err}), 404
+        return jsonify({"status": "Command sent", "devices": queued})
+    command_id, err = send_device_command(device_friendly, command_text)
     if err:
         # return error if command sending failed
         return jsonify({"error": err}), 404
-    return jsonify({"status": "Command sent", "command_id": command.id})
+    return jsonify({"status": "Command sent", "command_id": command_id})
 
 @api_bp.route('/api/command/<friendly_name>', methods=['GET'])
 def get_commands(friendly_name):
     """
     Endpoint to retrieve pending commands for a device.
+    With 'wait' (seconds, capped by COMMAND_MAX_WAIT_SECONDS, which is 0 unless long polling
+    is enabled) the request is held until a command is sent to the device or the wait
+    expires, then returns as usual.
     """
-    commands, err = get_pending_commands(friendly_name)
+    wait = request.args.get('wait', 0, type=float)
+    wait = min(wait, current_app.config.get('COMMAND_MAX_WAIT_SECONDS'))
+    if wait > 0:
+        commands, err = wait_for_commands(friendly_name, wait, current_app.config.get('COMMAND_RECHECK_SECONDS'))
+    else:
+        commands, err = get_pending_commands(friendly_name)
     if err:
         # return error if device not found
         return jsonify({"error": err}), 404
@@ -96,12 +351,15 @@ def register_device():
     new_device = Device(guid=new_guid, friendly_name=friendly_name, type=role)
     db.session.add(new_device)
     db.session.commit()
+    invalidate_device(new_guid)
+    schema_snapshot.invalidate()
     return jsonify({"device_guid": new_guid, "friendly_name": friendly_name, "type": role}), 201
 
 @api_bp.route('/api/schema', methods=['GET'])
 def schema():
     """
     Returns the current schema: a list of devices with their metrics and field definitions.
+    Served from a short-lived snapshot shared by every caller.
     """
-    schema_data = get_schema()
+    schema_data = schema_snapshot.get()
     return jsonify(schema_data)
\ No newline at end of file
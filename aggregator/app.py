@@ -3,8 +3,11 @@ from flask import Flask
 from flask_migrate import Migrate
 from models import db
 from api.routes import api_bp
+from api.gzip_request import GzipRequestMiddleware
 from dashapp import create_dash_app
 from config import Config
+from commands import register_commands
+from aggregator.services.ingest_queue import init_ingest_queue
 
 def create_app():
     """Application factory to create Flask app and attach extensions."""
@@ -12,6 +15,9 @@ def create_app():
 
     app.config.from_object(Config)
 
+    # Collectors may gzip their upload batches
+    app.wsgi_app = GzipRequestMiddleware(app.wsgi_app, app.config['MAX_DECOMPRESSED_BODY'])
+
     # Initialize DB
     db.init_app(app)
     Migrate(app, db)
@@ -23,4 +29,10 @@ def create_app():
     # Create and attach Dash app
     create_dash_app(app)
 
+    # Maintenance commands (e.g. `flask rebuild-latest`)
+    register_commands(app)
+
+    # Background writer for POST /api/metrics when INGEST_WRITE_BEHIND is enabled
+    init_ingest_queue(app)
+
     return app
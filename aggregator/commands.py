@@ -0,0 +1,37 @@
+import click
+from flask.cli import with_appcontext
+from aggregator.services.latest_service import rebuild_latest_readings
+from aggregator.services.rollup_service import apply_retention, run_rollups
+
+@click.command('rebuild-latest')
+@with_appcontext
+def rebuild_latest_command():
+    """Backfill the latest_reading projection from the existing reading history."""
+    count = rebuild_latest_readings()
+    click.echo(f"Rebuilt latest readings for {count} metrics.")
+
+@click.command('rollup')
+@click.option('--batch-size', type=int, default=None, help='Readings folded per transaction.')
+@with_appcontext
+def rollup_command(batch_size):
+    """Fold new readings into the 1m/1h/1d rollup tiers."""
+    count = run_rollups(batch_size)
+    click.echo(f"Rolled up {count} readings.")
+
+@click.command('apply-retention')
+@click.option('--raw-days', type=int, default=None, help='Keep raw readings for this many days.')
+@click.option('--batch-size', type=int, default=None, help='Readings deleted per transaction.')
+@with_appcontext
+def apply_retention_command(raw_days, batch_size):
+    """Delete raw readings, rollup rows and idempotency keys past their retention."""
+    deleted = apply_retention(raw_days, batch_size)
+    click.echo(
+        f"Deleted {deleted['readings']} readings, {deleted['rollups']} rollup rows "
+        f"and {deleted['receipts']} idempotency keys."
+    )
+
+def register_commands(app):
+    """Attach the aggregator maintenance commands to the Flask CLI."""
+    app.cli.add_command(rebuild_latest_command)
+    app.cli.add_command(rollup_command)
+    app.cli.add_command(apply_retention_command)
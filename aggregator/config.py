@@ -7,3 +7,55 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     API_KEY = os.environ.get('API_KEY', '1ecbdaa3-aa0d-4f28-ad9a-5cddfa2c42eb')
+    # Maximum number of device / metric definitions kept in the per-process ingest cache
+    DEFINITION_CACHE_SIZE = int(os.environ.get('DEFINITION_CACHE_SIZE', 4096))
+    # Seconds the latest-metrics and schema snapshots are shared before being recomputed
+    SNAPSHOT_TTL_SECONDS = float(os.environ.get('SNAPSHOT_TTL_SECONDS', 2))
+    # The GET /api/metrics?since= cursor trails the newest reading id by this long, like
+    # ROLLUP_SETTLE_SECONDS; changes within it are sent again by the next call
+    METRICS_CURSOR_SETTLE_SECONDS = float(os.environ.get('METRICS_CURSOR_SETTLE_SECONDS', 30))
+    # Raw reading storage engine: 'eav' (reading + reading_value) or 'wide' (reading_wide)
+    READING_STORAGE = os.environ.get('READING_STORAGE', 'eav')
+    # Rollups and retention (run with `flask rollup` and `flask apply-retention`)
+    ROLLUP_BATCH_SIZE = int(os.environ.get('ROLLUP_BATCH_SIZE', 10000))
+    # Rollups only fold readings up to an id that has settled for this long (see
+    # ReadingStore.max_reading_id); it must exceed the longest ingest transaction
+    ROLLUP_SETTLE_SECONDS = int(os.environ.get('ROLLUP_SETTLE_SECONDS', 300))
+    RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 5000))
+    RAW_RETENTION_DAYS = int(os.environ.get('RAW_RETENTION_DAYS', 90))
+    ROLLUP_1M_RETENTION_DAYS = int(os.environ.get('ROLLUP_1M_RETENTION_DAYS', 30))
+    ROLLUP_1H_RETENTION_DAYS = int(os.environ.get('ROLLUP_1H_RETENTION_DAYS', 365))
+    # Daily rollups are kept forever unless set
+    ROLLUP_1D_RETENTION_DAYS = int(os.environ['ROLLUP_1D_RETENTION_DAYS']) if os.environ.get('ROLLUP_1D_RETENTION_DAYS') else None
+    # Idempotency keys are remembered for this long (purged by `flask apply-retention`)
+    IDEMPOTENCY_KEY_RETENTION_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_RETENTION_HOURS', 48))
+    # Upper bound on the decompressed size of a gzip-encoded request body
+    MAX_DECOMPRESSED_BODY = int(os.environ.get('MAX_DECOMPRESSED_BODY', 16 * 1024 * 1024))
+    # Client timestamps more than this far ahead of the server clock are rejected, since a
+    # reading from the future would stay the latest one until the clock caught up
+    MAX_CLOCK_SKEW_SECONDS = int(os.environ.get('MAX_CLOCK_SKEW_SECONDS', 300))
+    # Maximum number of envelopes accepted by POST /api/metrics/batch
+    MAX_BATCH_ENVELOPES = int(os.environ.get('MAX_BATCH_ENVELOPES', 500))
+    # Write-behind ingest: POST /api/metrics queues payloads (202) for a background writer
+    INGEST_WRITE_BEHIND = os.environ.get('INGEST_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+    INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 10000))
+    INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 200))
+    INGEST_FLUSH_INTERVAL_MS = int(os.environ.get('INGEST_FLUSH_INTERVAL_MS', 500))
+    # Live metrics stream (GET /api/stream/metrics). Each open stream occupies a worker thread
+    # (a whole worker on sync servers such as uWSGI) for up to STREAM_MAX_SECONDS, so keep
+    # STREAM_MAX_SUBSCRIBERS well below the number of request threads; 0 disables streaming.
+    STREAM_BUFFER_SIZE = int(os.environ.get('STREAM_BUFFER_SIZE', 500))
+    STREAM_MAX_SUBSCRIBERS = int(os.environ.get('STREAM_MAX_SUBSCRIBERS', 4))
+    STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', 15))
+    # Streams are closed after this long (each holds a worker); browsers reconnect on their own
+    STREAM_MAX_SECONDS = int(os.environ.get('STREAM_MAX_SECONDS', 300))
+    # Long-polled command delivery (GET /api/command/<device>?wait=N) is off unless
+    # COMMAND_MAX_WAIT_SECONDS is set: like a stream, each waiting request holds a worker thread
+    # (a whole worker on sync servers such as uWSGI, where it should stay off).
+    # COMMAND_MAX_WAITERS is counted per worker process, so up to processes x COMMAND_MAX_WAITERS
+    # requests wait at once; keep that well below the total number of request threads. Others
+    # are answered at once. Waiting requests re-check the database every COMMAND_RECHECK_SECONDS
+    # for commands queued by other worker processes.
+    COMMAND_MAX_WAIT_SECONDS = float(os.environ.get('COMMAND_MAX_WAIT_SECONDS', 0))
+    COMMAND_MAX_WAITERS = int(os.environ.get('COMMAND_MAX_WAITERS', 1))
+    COMMAND_RECHECK_SECONDS = float(os.environ.get('COMMAND_RECHECK_SECONDS', 5))
@@ -1,5 +1,6 @@
 from dash import Dash, dcc, html, Input, Output
 import plotly.graph_objects as go
+from aggregator.services.snapshot_service import latest_snapshot, schema_snapshot
 
 def create_dash_app(flask_server):
     """
@@ -35,19 +36,15 @@ def create_dash_app(flask_server):
         """
         update and return the gauge components for dash layout
         """
-        # use flask test client to call api endpoints
+        # read the snapshots shared with the api routes instead of re-querying per browser
         try:
-            with flask_server.test_client() as client:
-                metrics_response = client.get("/api/metrics")
-                metrics_data = metrics_response.get_json()
+            metrics_data = latest_snapshot.get()
         except Exception as e:
             print("Error fetching metrics:", e)
             metrics_data = []
 
         try:
-            with flask_server.test_client() as client:
-                schema_response = client.get("/api/schema")
-                schema_data = schema_response.get_json()
+            schema_data = schema_snapshot.get()
         except Exception as e:
             print("Error fetching schema:", e)
             schema_data = []
@@ -9,7 +9,7 @@ class Device(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     guid = db.Column(db.String(36), unique=True, nullable=False)  # Server-assigned GUID
     friendly_name = db.Column(db.String(50), nullable=True)
-    type = db.Column(db.String(50), nullable=False)  # e.g., "PC-Metrics", "OpenSky-Collector"
+    type = db.Column(db.String(50), nullable=False, index=True)  # e.g., "PC-Metrics", "OpenSky-Collector"
     metrics = db.relationship('Metric', backref='device', lazy=True)
     commands = db.relationship('Command', backref='device', lazy=True)
 
@@ -41,19 +41,92 @@ class Reading(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     # Each reading may have multiple field values defined in the metric_field table
     reading_values = db.relationship('ReadingValue', backref='reading', lazy=True)
+    __table_args__ = (
+        # History, latest-reading and range queries filter on metric and sort on time
+        db.Index('ix_reading_metric_id_timestamp', 'metric_id', 'timestamp'),
+    )
 
 class ReadingValue(db.Model):
     __tablename__ = 'reading_value'
     id = db.Column(db.Integer, primary_key=True)
     reading_id = db.Column(db.Integer, db.ForeignKey('reading.id'), nullable=False)
     metric_field_id = db.Column(db.Integer, db.ForeignKey('metric_field.id'), nullable=False)
-    value = db.Column(db.String(255), nullable=False)
+    # Numeric field values are stored in numeric_value; value holds everything else
+    value = db.Column(db.String(255), nullable=True)
+    numeric_value = db.Column(db.Float(precision=53), nullable=True)
     __table_args__ = (
         UniqueConstraint('reading_id', 'metric_field_id', name='uq_reading_metric_field'),
     )
     # Define the relationship to MetricField
     metric_field = db.relationship('MetricField', lazy=True)
 
+class WideReading(db.Model):
+    __tablename__ = 'reading_wide'
+    # Alternative storage layout: one row per sample with five typed slots, where slot N
+    # holds the value of the metric field with field_index N
+    id = db.Column(db.Integer, primary_key=True)
+    metric_id = db.Column(db.Integer, db.ForeignKey('metric.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    num_1 = db.Column(db.Float(precision=53), nullable=True)
+    num_2 = db.Column(db.Float(precision=53), nullable=True)
+    num_3 = db.Column(db.Float(precision=53), nullable=True)
+    num_4 = db.Column(db.Float(precision=53), nullable=True)
+    num_5 = db.Column(db.Float(precision=53), nullable=True)
+    str_1 = db.Column(db.String(255), nullable=True)
+    str_2 = db.Column(db.String(255), nullable=True)
+    str_3 = db.Column(db.String(255), nullable=True)
+    str_4 = db.Column(db.String(255), nullable=True)
+    str_5 = db.Column(db.String(255), nullable=True)
+    __table_args__ = (
+        db.Index('ix_reading_wide_metric_id_timestamp', 'metric_id', 'timestamp'),
+    )
+
+class LatestReading(db.Model):
+    __tablename__ = 'latest_reading'
+    # One row per metric holding its newest reading, maintained by the ingest path
+    metric_id = db.Column(db.Integer, db.ForeignKey('metric.id'), primary_key=True)
+    reading_id = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    fields = db.Column(db.Text, nullable=False)  # JSON object of field name -> value, in field index order
+    metric = db.relationship('Metric', lazy=True)
+
+class ReadingRollup(db.Model):
+    __tablename__ = 'reading_rollup'
+    # Aggregates of a numeric field per time bucket; resolution is the bucket size in seconds
+    resolution = db.Column(db.Integer, primary_key=True)
+    metric_field_id = db.Column(db.Integer, db.ForeignKey('metric_field.id'), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    metric_id = db.Column(db.Integer, db.ForeignKey('metric.id'), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    min_value = db.Column(db.Float(precision=53), nullable=False)
+    max_value = db.Column(db.Float(precision=53), nullable=False)
+    sum_value = db.Column(db.Float(precision=53), nullable=False)
+    last_value = db.Column(db.Float(precision=53), nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.Index('ix_reading_rollup_metric_id_resolution_bucket_start', 'metric_id', 'resolution', 'bucket_start'),
+    )
+
+class RollupWatermark(db.Model):
+    __tablename__ = 'rollup_watermark'
+    # Highest reading id already folded into the rollup tiers
+    name = db.Column(db.String(20), primary_key=True)
+    last_reading_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Highest reading id when horizon_at was recorded; rollups may pass it once it has settled
+    horizon_reading_id = db.Column(db.Integer, nullable=True)
+    horizon_at = db.Column(db.DateTime, nullable=True)
+
+class IngestReceipt(db.Model):
+    __tablename__ = 'ingest_receipt'
+    # Idempotency keys of ingested payloads, so a re-sent payload is only stored once
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), primary_key=True)
+    idempotency_key = db.Column(db.String(64), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_ingest_receipt_created_at', 'created_at'),
+    )
+
 class Command(db.Model):
     __tablename__ = 'command'
     id = db.Column(db.Integer, primary_key=True)
@@ -61,3 +134,10 @@ class Command(db.Model):
     command_text = db.Column(db.String(100), nullable=False)
     executed = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Random token written by the UPDATE that claimed (delivered) the command
+    claim_token = db.Column(db.String(32), nullable=True)
+    __table_args__ = (
+        # Pending-command and cooldown checks filter on device and state, sorting on time
+        db.Index('ix_command_device_id_executed_timestamp', 'device_id', 'executed', 'timestamp'),
+        db.Index('ix_command_claim_token', 'claim_token'),
+    )
@@ -0,0 +1,58 @@
+import threading
+from aggregator.config import Config
+
+
+class CommandNotifier:
+    """
+    In-process registry that wakes long-polling command requests when a command is queued.
+
+    Each device (by friendly name) has a version that notify() bumps (notify_all() bumps
+    every device's, for broadcast commands). A waiter reads the
+    version before checking the database and then waits for it to change, so a command
+    queued between the check and the wait is not missed. Only waiters in the process that
+    queued the command are woken; others find it on their next periodic re-check.
+    """
+
+    def __init__(self, max_waiters):
+        self.max_waiters = max_waiters
+        self.waiters = 0
+        self._versions = {}
+        self._broadcasts = 0
+        self._changed = threading.Condition()
+
+    def version(self, device_friendly):
+        with self._changed:
+            return self._version(device_friendly)
+
+    def _version(self, device_friendly):
+        return self._broadcasts, self._versions.get(device_friendly, 0)
+
+    def notify(self, device_friendly):
+        with self._changed:
+            self._versions[device_friendly] = self._versions.get(device_friendly, 0) + 1
+            self._changed.notify_all()
+
+    def notify_all(self):
+        with self._changed:
+            self._broadcasts += 1
+            self._changed.notify_all()
+
+    def acquire(self):
+        """Reserve a waiter slot. Returns False if max_waiters requests are already waiting."""
+        with self._changed:
+            if self.waiters >= self.max_waiters:
+                return False
+            self.waiters += 1
+            return True
+
+    def release(self):
+        with self._changed:
+            self.waiters -= 1
+
+    def wait(self, device_friendly, version, timeout):
+        """Wait up to `timeout` seconds for the device's version to move past `version`."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._version(device_friendly) != version, timeout)
+
+
+command_notifier = CommandNotifier(Config.COMMAND_MAX_WAITERS)
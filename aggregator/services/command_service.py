@@ -1,47 +1,140 @@
+import logging
+import time
+import uuid
+from sqlalchemy import and_, false, insert, literal, select, true
+from sqlalchemy.exc import OperationalError
 from aggregator.models import db, Device, Command
+from aggregator.services.command_notifier import command_notifier
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
+# Minimum time between a device's last executed command and the next one
+COMMAND_COOLDOWN = timedelta(minutes=3)
+# MySQL error raised when InnoDB rolls a statement back to break a deadlock
+MYSQL_DEADLOCK = 1213
+
+def _device_id(device_friendly):
+    row = db.session.query(Device.id).filter_by(friendly_name=device_friendly).order_by(Device.id).first()
+    return row.id if row else None
+
+def _queue_statement(device_filter, command_text):
+    """
+    Build a single INSERT ... SELECT that queues the command for every device matching
+    `device_filter` with no pending command and no command executed within the cooldown.
+
+    The checks are anti-joins in the same statement as the insert (MySQL does not allow a
+    subquery on the table being inserted into), so they cannot be invalidated between check
+    and insert the way separate queries can; at MySQL's default isolation level the
+    statement locks the index ranges it checked until commit.
+    """
+    now = datetime.utcnow()
+    command = Command.__table__
+    pending = command.alias('pending')
+    recent = command.alias('recent')
+    devices = (
+        select(Device.id, literal(command_text), literal(False), literal(now))
+        .select_from(
+            Device.__table__
+            .outerjoin(pending, and_(pending.c.device_id == Device.id, pending.c.executed == false()))
+            .outerjoin(recent, and_(
+                recent.c.device_id == Device.id,
+                recent.c.executed == true(),
+                recent.c.timestamp > now - COMMAND_COOLDOWN
+            ))
+        )
+        .where(device_filter, pending.c.id.is_(None), recent.c.id.is_(None))
+    )
+    return insert(command).from_select(['device_id', 'command_text', 'executed', 'timestamp'], devices)
+
+def _is_deadlock(error):
+    orig = error.orig
+    code = getattr(orig, 'errno', None) or (orig.args[0] if orig.args else None)
+    return code == MYSQL_DEADLOCK
+
+def _queue_commands(device_filter, command_text):
+    """
+    Execute the queueing INSERT ... SELECT. The range locks it takes can deadlock with a
+    concurrent insert or claim for the same devices; MySQL then rolls it back, so it is
+    retried once, like a conflicting ingest batch.
+    """
+    try:
+        return db.session.execute(_queue_statement(device_filter, command_text))
+    except OperationalError as e:
+        db.session.rollback()
+        if not _is_deadlock(e):
+            raise
+        logger.info("Queueing command '%s' deadlocked with a concurrent write; retrying", command_text)
+        return db.session.execute(_queue_statement(device_filter, command_text))
+
 def send_device_command(device_friendly, command_text):
     """
     Send a command to a device with safeguards:
       - Do not add a new command if there is already a pending (unexecuted) command.
       - Enforce a time limit of 3 minutes between executing commands.
+    Both are checked by the statement that inserts the command.
+    Returns the new command id and None, or None and an error message.
     """
-    device = Device.query.filter_by(friendly_name=device_friendly).first()
-    if not device:
+    device_id = _device_id(device_friendly)
+    if device_id is None:
         return None, "Device not found"
-    
-    # Check for existing pending (unexecuted) commands for this device.
-    pending_command = Command.query.filter_by(device_id=device.id, executed=False).first()
-    if pending_command:
-        return None, "A command is already pending for this device. Please wait until it is executed."
-    
-    # Check when the last executed command was issued (timestamp).
-    last_command = (
-        Command.query.filter_by(device_id=device.id, executed=True)
-        .order_by(Command.timestamp.desc())
-        .first()
-    )
-    if last_command:
-        elapsed = datetime.utcnow() - last_command.timestamp
-        if elapsed < timedelta(minutes=3):
-            return None, "A command was executed less than 3 minutes ago. Please wait before sending a new command."
-
-    # All safeguards passed: add the new command.
-    new_command = Command(device_id=device.id, command_text=command_text)
-    db.session.add(new_command)
+
+    result = _queue_commands(Device.id == device_id, command_text)
+    if not result.rowcount:
+        db.session.rollback()
+        # Only a rejected command pays for finding out why.
+        pending = Command.query.filter_by(device_id=device_id, executed=False).first()
+        if pending:
+            return None, "A command is already pending for this device. Please wait until it is executed."
+        return None, "A command was executed less than 3 minutes ago. Please wait before sending a new command."
+    command_id = result.lastrowid
+    db.session.commit()
+    # Wake any request long-polling for this device's commands
+    command_notifier.notify(device_friendly)
+    return command_id, None
+
+def broadcast_command(device_type, command_text):
+    """
+    Send a command to every device of a type in one INSERT ... SELECT, with the same
+    safeguards as send_device_command; devices that already have a pending command or
+    executed one within the last 3 minutes are skipped.
+    Returns the number of devices the command was queued for and None, or None and an
+    error message if there is no device of that type.
+    """
+    result = _queue_commands(Device.type == device_type, command_text)
+    queued = result.rowcount
     db.session.commit()
-    # return new command and None error
-    return new_command, None
+    if not queued and not db.session.query(Device.id).filter_by(type=device_type).first():
+        return None, "No device of this type"
+    if queued:
+        command_notifier.notify_all()
+    return queued, None
 
 def get_pending_commands(device_friendly):
     """
     Retrieve pending commands for a given device and mark them as executed.
+
+    The commands are claimed by a single UPDATE that marks them executed and tags them with
+    a fresh claim token, then read back by that token, so concurrent requests for the same
+    device never receive the same command.
     """
-    device = Device.query.filter_by(friendly_name=device_friendly).first()
-    if not device:
+    device_id = _device_id(device_friendly)
+    if device_id is None:
         return None, "Device not found"
-    commands = Command.query.filter_by(device_id=device.id, executed=False).all()
+    token = uuid.uuid4().hex
+    claimed = (
+        Command.query.filter_by(device_id=device_id, executed=False)
+        .update({'executed': True, 'claim_token': token}, synchronize_session=False)
+    )
+    commands = []
+    if claimed:
+        commands = (
+            db.session.query(Command.id, Command.command_text, Command.timestamp)
+            .filter_by(claim_token=token)
+            .order_by(Command.id)
+            .all()
+        )
+    db.session.commit()
     response = []
     for cmd in commands:
         response.append({
@@ -49,6 +142,27 @@ def get_pending_commands(device_friendly):
             'command': cmd.command_text,
             'timestamp': cmd.timestamp.strftime("%Y-%m-%d %H:%M:%S")
         })
-        cmd.executed = True
-    db.session.commit()
     return response, None
+
+def wait_for_commands(device_friendly, timeout, recheck_interval):
+    """
+    Like get_pending_commands, but if nothing is pending wait up to `timeout` seconds for a
+    command to be sent to the device. Waiting requests are woken by send_device_command in
+    this process, and re-check the database every `recheck_interval` seconds for commands
+    sent through other processes. When too many requests are already waiting, this returns
+    at once like get_pending_commands.
+    """
+    if not command_notifier.acquire():
+        return get_pending_commands(device_friendly)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            # Read the version first so a command sent during the check still wakes the wait.
+            version = command_notifier.version(device_friendly)
+            commands, err = get_pending_commands(device_friendly)
+            remaining = deadline - time.monotonic()
+            if err or commands or remaining <= 0:
+                return commands, err
+            command_notifier.wait(device_friendly, version, min(remaining, recheck_interval))
+    finally:
+        command_notifier.release()
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict, namedtuple
+from aggregator.config import Config
+from aggregator.models import db, Device
+
+# Lightweight, immutable copies of schema rows so cached entries never touch the session.
+DeviceRef = namedtuple('DeviceRef', ['id', 'guid', 'friendly_name'])
+FieldRef = namedtuple('FieldRef', ['id', 'field_index', 'field_type'])
+MetricDefinition = namedtuple('MetricDefinition', ['metric_id', 'fields'])  # fields: {field_name: FieldRef}
+
+# Marker stored for GUIDs that are known not to be registered.
+_UNREGISTERED = object()
+
+
+class LRUCache:
+    """
+    A small thread-safe cache with a bounded size and least-recently-used eviction.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Remove every entry whose key matches the predicate."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# guid -> DeviceRef (or _UNREGISTERED)
+device_cache = LRUCache(Config.DEFINITION_CACHE_SIZE)
+# (device_guid, metric_name) -> MetricDefinition
+metric_cache = LRUCache(Config.DEFINITION_CACHE_SIZE)
+
+
+def get_device_ref(guid):
+    """
+    Return a DeviceRef for the given GUID, or None if the device is not registered.
+    Both outcomes are cached so repeated posts from the same collector skip the lookup.
+    """
+    cached = device_cache.get(guid)
+    if cached is _UNREGISTERED:
+        return None
+    if cached is not None:
+        return cached
+
+    row = db.session.query(Device.id, Device.guid, Device.friendly_name).filter_by(guid=guid).first()
+    device_ref = DeviceRef(row.id, row.guid, row.friendly_name) if row else None
+    device_cache.put(guid, device_ref or _UNREGISTERED)
+    return device_ref
+
+
+def invalidate_device(guid):
+    """Drop a device and all of its metric definitions from the cache."""
+    device_cache.invalidate(guid)
+    metric_cache.invalidate_where(lambda key: key[0] == guid)
+
+
+def get_metric_definition(device_guid, metric_name):
+    return metric_cache.get((device_guid, metric_name))
+
+
+def store_metric_definition(device_guid, metric_name, definition):
+    metric_cache.put((device_guid, metric_name), definition)
+
+
+def invalidate_metric_definition(device_guid, metric_name):
+    metric_cache.invalidate((device_guid, metric_name))
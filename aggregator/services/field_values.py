@@ -0,0 +1,24 @@
+import math
+
+
+def encode_value(field_type, value):
+    """
+    Split an incoming field value into the (value, numeric_value) columns of reading_value.
+    Numeric fields are stored in the native numeric column; anything that cannot be stored
+    as a finite number (or belongs to a string field) is kept as text.
+    """
+    if field_type == 'numeric' and not isinstance(value, bool):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = None
+        if number is not None and math.isfinite(number):
+            return None, number
+    return str(value), None
+
+
+def decode_value(value, numeric_value):
+    """Return the typed value of a reading_value row for serialization."""
+    if numeric_value is None:
+        return value
+    return int(numeric_value) if numeric_value.is_integer() else numeric_value
@@ -1,31 +1,104 @@
-from aggregator.models import Reading
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from aggregator.storage import get_storage
 from collections import OrderedDict
 
-def get_metric_history(metric_id, page, page_size):
+def encode_cursor(timestamp, reading_id):
+    """Encode the position of a reading as an opaque, URL-safe cursor."""
+    raw = f"{timestamp.isoformat()},{reading_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor into a (timestamp, reading_id) tuple.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, reading_id = raw.rsplit(',', 1)
+        return datetime.fromisoformat(timestamp), int(reading_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _serialize(storage, readings):
     """
-    Retrieve historical readings for a given metric with pagination.
-    Returns a dictionary with pagination info and a list of history records.
+    Serialize a page of readings with one query for all of their values and field definitions.
+    Fields are ordered through a field-index map built once per page rather than per reading.
     """
-    query = Reading.query.filter_by(metric_id=metric_id).order_by(Reading.timestamp.desc())
-    pagination = query.paginate(page, page_size, error_out=False)
+    if not readings:
+        return []
+    values = storage.load_values([r.id for r in readings])
+
+    # field index -> field name, in field index order
+    field_order = OrderedDict(sorted({(index, name) for entries in values.values() for index, name, _ in entries}))
+    values_by_reading = {
+        reading_id: {index: value for index, _, value in entries}
+        for reading_id, entries in values.items()
+    }
 
     history = []
-    for r in pagination.items:
-        # sort reading values by field index
-        sorted_rvs = sorted(r.reading_values, key=lambda rv: rv.metric_field.field_index)
+    for r in readings:
+        reading_values = values_by_reading.get(r.id, {})
         ordered_fields = OrderedDict()
-        for rv in sorted_rvs:
-            # add field name and value to ordered dictionary
-            ordered_fields[rv.metric_field.field_name] = rv.value
+        for field_index, field_name in field_order.items():
+            if field_index in reading_values:
+                # add field name and value to ordered dictionary
+                ordered_fields[field_name] = reading_values[field_index]
         history.append({
             'timestamp': r.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
             'fields': ordered_fields
         })
+    return history
+
+def get_metric_history(metric_id, page=1, page_size=20, before=None, include_total=True):
+    """
+    Retrieve historical readings for a given metric, newest first.
+
+    Two pagination modes are supported:
+      - Offset mode (default): `page` selects the page.
+      - Keyset mode: `before` is a cursor returned as `next_cursor` by a previous call and
+        the page starts right after that reading, so deep pages cost the same as the first.
+    With include_total=False the COUNT(*) is skipped and 'total'/'pages' are None.
+
+    A page costs two queries (readings, then their values with field definitions) plus the
+    optional count.
+
+    Returns a dictionary with pagination info, a list of history records and a `next_cursor`
+    (None when there are no older readings).
+
+    Raises:
+        ValueError: If `before` is not a valid cursor.
+    """
+    storage = get_storage()
+    model = storage.model
+    query = storage.history_query(metric_id)
+    total = query.count() if include_total else None
+
+    if before is not None:
+        before_ts, before_id = decode_cursor(before)
+        query = query.filter(or_(
+            model.timestamp < before_ts,
+            and_(model.timestamp == before_ts, model.id < before_id)
+        ))
+        page = None
+    query = query.order_by(model.timestamp.desc(), model.id.desc())
+    if page is not None:
+        query = query.offset((page - 1) * page_size)
+
+    # Fetch one extra row to learn whether an older page exists.
+    readings = query.limit(page_size + 1).all()
+    has_more = len(readings) > page_size
+    readings = readings[:page_size]
+    next_cursor = encode_cursor(readings[-1].timestamp, readings[-1].id) if has_more else None
 
     return {
         'page': page,
         'page_size': page_size,
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'history': history
+        'total': total,
+        'pages': -(-total // page_size) if total is not None and page_size else None,
+        'history': _serialize(storage, readings),
+        'next_cursor': next_cursor
     }
@@ -0,0 +1,166 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from aggregator.services.metrics_service import ingest_envelopes
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    """Raised by WriteBehindQueue.put when the queue is at capacity."""
+
+
+class WriteBehindQueue:
+    """
+    A bounded in-process queue of ingest envelopes drained by one background writer.
+
+    The writer collects envelopes into micro-batches, flushing when batch_size envelopes are
+    waiting or flush_interval seconds after the first envelope of the batch arrived, and
+    stores each batch with ingest_envelopes in a single transaction. If a batch fails, its
+    envelopes are retried one by one so a single bad payload does not discard the others.
+
+    Queued envelopes only live in memory: anything still queued when the process is killed
+    (rather than shut down) is lost, which is why write-behind mode is opt-in.
+    """
+
+    def __init__(self, app, maxsize, batch_size, flush_interval):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.envelopes_written = 0
+        self.last_batch_ms = None
+        self.max_batch_ms = 0.0
+        self._total_batch_ms = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def put(self, envelope):
+        """
+        Queue an Envelope without blocking. Its received_at is set to the time it was
+        accepted, so payloads without a client timestamp are not stamped with the write time.
+
+        Raises:
+            IngestQueueFull: If the queue is at capacity or shutting down.
+        """
+        if self._stopping.is_set():
+            raise IngestQueueFull("Ingest queue is shutting down")
+        try:
+            self._queue.put_nowait(envelope._replace(received_at=datetime.utcnow()))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise IngestQueueFull("Ingest queue is full")
+        with self._stats_lock:
+            self.accepted += 1
+
+    def stop(self, timeout=30):
+        """Stop accepting payloads and wait for the writer to flush what is queued."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("Ingest writer did not flush within %ss; %d envelope(s) dropped",
+                               timeout, self._queue.qsize())
+            self._thread = None
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'depth': self._queue.qsize(),
+                'capacity': self._queue.maxsize,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'batches': self.batches,
+                'envelopes_written': self.envelopes_written,
+                'last_batch_ms': self.last_batch_ms,
+                'avg_batch_ms': round(self._total_batch_ms / self.batches, 2) if self.batches else None,
+                'max_batch_ms': self.max_batch_ms,
+            }
+
+    def _next_batch(self):
+        """Block for the first envelope, then collect more until the size or time trigger fires."""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                # Once stopping, take whatever is already queued without waiting.
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                with self.app.app_context():
+                    self._write(batch)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            ingest_envelopes(batch)
+            written, failed = len(batch), 0
+        except Exception:
+            logger.exception("Write-behind batch of %d envelope(s) failed; retrying individually", len(batch))
+            written, failed = 0, 0
+            for envelope in batch:
+                try:
+                    ingest_envelopes([envelope])
+                    written += 1
+                except Exception:
+                    failed += 1
+                    logger.exception("Dropping queued metrics for device %s", envelope.device.guid)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        with self._stats_lock:
+            self.batches += 1
+            self.envelopes_written += written
+            self.failed += failed
+            self.last_batch_ms = elapsed_ms
+            self.max_batch_ms = max(self.max_batch_ms, elapsed_ms)
+            self._total_batch_ms += elapsed_ms
+
+
+def init_ingest_queue(app):
+    """
+    Start the write-behind queue when INGEST_WRITE_BEHIND is enabled and attach it to the
+    app as app.extensions['ingest_queue'] (None when POSTs are processed synchronously).
+    """
+    ingest_queue = None
+    if app.config.get('INGEST_WRITE_BEHIND'):
+        ingest_queue = WriteBehindQueue(
+            app,
+            maxsize=app.config['INGEST_QUEUE_SIZE'],
+            batch_size=app.config['INGEST_BATCH_SIZE'],
+            flush_interval=app.config['INGEST_FLUSH_INTERVAL_MS'] / 1000.0
+        )
+        ingest_queue.start()
+    app.extensions['ingest_queue'] = ingest_queue
+    return ingest_queue
@@ -0,0 +1,89 @@
+import json
+from sqlalchemy import func
+from aggregator.models import db, LatestReading
+from aggregator.storage import get_storage
+
+# Number of metrics backfilled per transaction by rebuild_latest_readings
+REBUILD_BATCH_SIZE = 500
+
+
+def _upsert_statement(rows):
+    """
+    Build a dialect-specific multi-row upsert into latest_reading.
+    An existing row is only replaced by a reading that is at least as new.
+    """
+    table = LatestReading.__table__
+    dialect = db.session.get_bind().dialect.name
+    columns = ('reading_id', 'fields', 'timestamp')
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        is_newer = stmt.inserted.timestamp >= table.c.timestamp
+        # MySQL applies the assignments left to right, so timestamp must be updated last.
+        return stmt.on_duplicate_key_update([
+            (column, func.if_(is_newer, stmt.inserted[column], table.c[column]))
+            for column in columns
+        ])
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.metric_id],
+            set_={column: stmt.excluded[column] for column in columns},
+            where=stmt.excluded.timestamp >= table.c.timestamp
+        )
+
+    raise NotImplementedError(f"latest_reading upsert is not supported on {dialect}")
+
+
+def upsert_latest_readings(rows):
+    """
+    Upsert the latest_reading projection inside the caller's transaction.
+
+    Each row is a dictionary with 'metric_id', 'reading_id', 'timestamp' and 'fields'
+    (an ordered dictionary of field name -> value). Does not commit.
+    """
+    # A statement may only touch each metric once; keep the newest row per metric.
+    newest = {}
+    for row in rows:
+        current = newest.get(row['metric_id'])
+        if current is None or (row['timestamp'], row['reading_id']) >= (current['timestamp'], current['reading_id']):
+            newest[row['metric_id']] = row
+    if not newest:
+        return 0
+
+    values = [
+        {
+            'metric_id': row['metric_id'],
+            'reading_id': row['reading_id'],
+            'timestamp': row['timestamp'],
+            'fields': json.dumps(row['fields'])
+        }
+        for row in newest.values()
+    ]
+    db.session.execute(_upsert_statement(values))
+    return len(values)
+
+
+def rebuild_latest_readings():
+    """
+    Backfill the latest_reading projection from the reading history of the configured
+    storage engine. Metrics are processed in batches, each batch in its own transaction.
+    Returns the number of metrics written.
+    """
+    storage = get_storage()
+    model = storage.model
+    metric_ids = [row.metric_id for row in db.session.query(model.metric_id).distinct().all()]
+    written = 0
+    for start in range(0, len(metric_ids), REBUILD_BATCH_SIZE):
+        rows = storage.latest_samples(metric_ids[start:start + REBUILD_BATCH_SIZE])
+        if not rows:
+            continue
+        written += upsert_latest_readings(rows)
+        db.session.commit()
+    return written
@@ -1,26 +1,38 @@
-from aggregator.models import Metric, Reading
+import json
+from aggregator.models import db, Device, LatestReading, Metric
 
 def get_latest_metrics():
     """
     Retrieve the latest reading for each metric and return a list of dictionaries
     with aggregated metric data.
+
+    Reads the latest_reading projection maintained at ingest time, so the cost is a
+    single query over one row per metric regardless of how much history exists.
+    Each item carries the id of its reading, which only grows as new readings arrive.
     """
+    latest_readings = (
+        db.session.query(
+            LatestReading.metric_id,
+            LatestReading.reading_id,
+            LatestReading.timestamp,
+            LatestReading.fields,
+            Metric.name,
+            Device.friendly_name
+        )
+        .join(Metric, Metric.id == LatestReading.metric_id)
+        .join(Device, Device.id == Metric.device_id)
+        .order_by(LatestReading.metric_id)
+        .all()
+    )
+
     metrics_data = []
-    metrics = Metric.query.all()
-    for metric in metrics:
-        latest_reading = Reading.query.filter_by(metric_id=metric.id)\
-                                      .order_by(Reading.timestamp.desc())\
-                                      .first()
-        if latest_reading:
-            fields = {}
-            for rv in latest_reading.reading_values:
-                # add field name and value to fields dictionary
-                fields[rv.metric_field.field_name] = rv.value
-            metrics_data.append({
-                'device': metric.device.friendly_name,
-                'metric': metric.name,
-                'fields': fields,
-                'timestamp': latest_reading.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                'metric_id': metric.id
-            })
+    for r in latest_readings:
+        metrics_data.append({
+            'device': r.friendly_name,
+            'metric': r.name,
+            'fields': json.loads(r.fields),
+            'timestamp': r.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            'metric_id': r.metric_id,
+            'reading_id': r.reading_id
+        })
     return metrics_data
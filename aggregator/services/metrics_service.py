@@ -1,70 +1,371 @@
-from aggregator.models import db, Metric, MetricField, Reading, ReadingValue
+import logging
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from aggregator.models import db, IngestReceipt, Metric, MetricField
+from aggregator.services.definition_cache import (
+    FieldRef,
+    MetricDefinition,
+    get_metric_definition,
+    invalidate_metric_definition,
+    store_metric_definition,
+)
+from aggregator.services.field_values import decode_value, encode_value
+from aggregator.services.latest_service import upsert_latest_readings
+from aggregator.services.snapshot_service import schema_snapshot
+from aggregator.services.stream_broker import metrics_broker
+from aggregator.storage import Sample, get_storage
 
-def process_metrics(device, metrics_list):
+logger = logging.getLogger(__name__)
+
+# metric_field.field_index is constrained to 1..5
+MAX_FIELDS_PER_METRIC = 5
+
+# One ingest payload: the device (a Device or DeviceRef) and its list of metric dictionaries.
+# timestamp is the client's collection time (naive UTC); payloads carrying one are deduplicated
+# on (metric_id, timestamp). idempotency_key deduplicates whole payloads per device.
+# received_at is when the server accepted a payload that is written later (write-behind).
+Envelope = namedtuple(
+    'Envelope',
+    ['device', 'metrics', 'timestamp', 'idempotency_key', 'received_at'],
+    defaults=(None, None, None)
+)
+
+
+def _field_type(value):
+    """Infer the stored field type from an incoming value."""
+    return 'numeric' if isinstance(value, (int, float)) else 'string'
+
+
+def _load_definitions(device_id, metric_names):
     """
-    Process a list of metrics for the given device.
-    
-    For each metric in the list:
-      - If the metric does not exist, create it and define its fields.
-      - If it exists, check for new fields and add them if needed.
-      - Create a new reading and record the reading values.
-    """
-    for metric_data in metrics_list:
-        metric_name = metric_data.get('name')
-        fields_data = metric_data.get('fields')
-        if not metric_name or not fields_data:
-            continue  # Skip invalid metric data
-
-        # Check if the metric exists for this device.
-        metric = Metric.query.filter_by(device_id=device.id, name=metric_name).first()
-        if not metric:
-            # Create a new metric.
-            metric = Metric(device_id=device.id, name=metric_name)
-            db.session.add(metric)
-            db.session.commit()  # Commit to obtain metric.id
-
-            # Create field definitions based on incoming data.
-            index = 1
-            for field_name, field_value in fields_data.items():
-                field_type = 'numeric' if isinstance(field_value, (int, float)) else 'string'
-                mf = MetricField(
-                    metric_id=metric.id,
-                    field_index=index,
-                    field_name=field_name,
-                    field_type=field_type
-                )
-                db.session.add(mf)
-                index += 1
-            db.session.commit()
-        else:
-            # Metric exists—check for any new fields.
-            existing_field_names = {mf.field_name for mf in metric.metric_fields}
-            next_index = len(metric.metric_fields) + 1
-            for field_name, field_value in fields_data.items():
-                if field_name not in existing_field_names and next_index <= 5:
-                    field_type = 'numeric' if isinstance(field_value, (int, float)) else 'string'
-                    mf = MetricField(
-                        metric_id=metric.id,
-                        field_index=next_index,
-                        field_name=field_name,
-                        field_type=field_type
-                    )
-                    db.session.add(mf)
-                    next_index += 1
-            db.session.commit()
-
-        # Create a new Reading for the metric.
-        reading = Reading(metric_id=metric.id)
-        db.session.add(reading)
-        db.session.commit()
+    Load the named metrics of a device together with their field definitions in a single query.
+    Returns a dictionary of metric name -> MetricDefinition.
+    """
+    rows = (
+        db.session.query(
+            Metric.id.label('metric_id'),
+            Metric.name,
+            MetricField.id.label('field_id'),
+            MetricField.field_index,
+            MetricField.field_name,
+            MetricField.field_type
+        )
+        .outerjoin(MetricField, MetricField.metric_id == Metric.id)
+        .filter(Metric.device_id == device_id, Metric.name.in_(metric_names))
+        .all()
+    )
+    definitions = {}
+    for row in rows:
+        definition = definitions.setdefault(row.name, MetricDefinition(row.metric_id, {}))
+        if row.field_id is not None:
+            definition.fields[row.field_name] = FieldRef(row.field_id, row.field_index, row.field_type)
+    return definitions
+
+
+def _resolve_definitions(device, wanted, pending=None):
+    """
+    Resolve the definitions for a payload, preferring definitions already staged by the
+    current transaction (`pending`, keyed by (device guid, metric name)) and then the
+    in-process cache.
+    A cached definition that lacks one of the payload's field names is reloaded, since
+    another worker may have added that field since it was cached.
+    Returns the definitions and the number of schema queries issued (0 or 1).
+    """
+    pending = pending or {}
+    definitions = {}
+    for metric_name, field_names in wanted.items():
+        definition = pending.get((device.guid, metric_name)) or get_metric_definition(device.guid, metric_name)
+        if definition is not None and (
+            len(definition.fields) >= MAX_FIELDS_PER_METRIC or field_names <= definition.fields.keys()
+        ):
+            definitions[metric_name] = definition
+    stale = set(wanted) - set(definitions)
+    if not stale:
+        return definitions, 0
+    definitions.update(_load_definitions(device.id, stale))
+    return definitions, 1
+
+
+def _valid_samples(metrics_list):
+    """Return (name, fields) for every metric dictionary carrying both."""
+    return [
+        (metric_data.get('name'), metric_data.get('fields'))
+        for metric_data in metrics_list
+        if metric_data.get('name') and metric_data.get('fields')
+    ]
+
+
+def _stage_definitions(device, samples, wanted, pending, stats):
+    """
+    Resolve the definitions of one device's samples, creating missing metrics and fields
+    (flushed, not committed). Returns a dictionary of metric name -> MetricDefinition.
+    """
+    definitions, schema_queries = _resolve_definitions(device, wanted, pending)
+    stats['schema_queries'] += schema_queries
+
+    # Create any metrics that do not exist yet; flush once to obtain their ids.
+    new_metrics = [Metric(device_id=device.id, name=name) for name in wanted if name not in definitions]
+    if new_metrics:
+        db.session.add_all(new_metrics)
+        db.session.flush()
+        for metric in new_metrics:
+            definitions[metric.name] = MetricDefinition(metric.id, {})
+        stats['metrics_created'] += len(new_metrics)
+
+    # Add field definitions for any fields not seen before (up to 5 per metric).
+    new_fields = {}
+    for metric_name, fields_data in samples:
+        definition = definitions[metric_name]
+        added = new_fields.setdefault(metric_name, {})
+        next_index = max(
+            [f.field_index for f in definition.fields.values()] + [mf.field_index for mf in added.values()],
+            default=0
+        ) + 1
+        for field_name, field_value in fields_data.items():
+            if field_name in definition.fields or field_name in added or next_index > MAX_FIELDS_PER_METRIC:
+                continue
+            added[field_name] = MetricField(
+                metric_id=definition.metric_id,
+                field_index=next_index,
+                field_name=field_name,
+                field_type=_field_type(field_value)
+            )
+            next_index += 1
+    created_fields = [mf for added in new_fields.values() for mf in added.values()]
+    if created_fields:
+        db.session.add_all(created_fields)
+        db.session.flush()
+        # Cached definitions are shared, so build new ones rather than mutating them.
+        for metric_name, added in new_fields.items():
+            if added:
+                definition = definitions[metric_name]
+                fields = dict(definition.fields)
+                for field_name, mf in added.items():
+                    fields[field_name] = FieldRef(mf.id, mf.field_index, mf.field_type)
+                definitions[metric_name] = MetricDefinition(definition.metric_id, fields)
+        stats['fields_created'] += len(created_fields)
+    return definitions
+
+
+def _encode_samples(definitions, samples, timestamp):
+    """
+    Encode each sample's values for its field types. Returns the storage engine samples and,
+    in the same order, the typed field dictionaries for the latest_reading projection.
+    """
+    store_samples = []
+    latest_fields = []
+    for metric_name, fields_data in samples:
+        definition = definitions[metric_name]
+        values = []
+        typed_fields = []
+        for field_name, field_value in fields_data.items():
+            field = definition.fields.get(field_name)
+            if field is not None:
+                value, numeric_value = encode_value(field.field_type, field_value)
+                values.append((field, value, numeric_value))
+                typed_fields.append((field.field_index, field_name, decode_value(value, numeric_value)))
+        store_samples.append(Sample(definition.metric_id, timestamp, values))
+        latest_fields.append(OrderedDict((name, value) for _, name, value in sorted(typed_fields)))
+    return store_samples, latest_fields
+
+
+def _claim_receipts(envelopes):
+    """
+    Record the idempotency key of every keyed envelope (no commit) and return the indexes of
+    the envelopes whose key was already ingested, including repeats within the batch.
+    A concurrent writer claiming the same key makes the transaction fail on the primary key.
+    """
+    keyed = [(index, envelope) for index, envelope in enumerate(envelopes) if envelope.idempotency_key]
+    if not keyed:
+        return set()
+    seen = {
+        (row.device_id, row.idempotency_key)
+        for row in db.session.query(IngestReceipt.device_id, IngestReceipt.idempotency_key).filter(
+            IngestReceipt.device_id.in_({envelope.device.id for _, envelope in keyed}),
+            IngestReceipt.idempotency_key.in_({envelope.idempotency_key for _, envelope in keyed})
+        )
+    }
+    duplicates = set()
+    for index, envelope in keyed:
+        key = (envelope.device.id, envelope.idempotency_key)
+        if key in seen:
+            duplicates.add(index)
+            continue
+        seen.add(key)
+        db.session.add(IngestReceipt(device_id=key[0], idempotency_key=key[1]))
+    return duplicates
+
+
+def _drop_duplicate_samples(storage, store_samples, latest_fields, client_stamped):
+    """
+    Drop client-stamped samples whose (metric_id, timestamp) is repeated in the batch or
+    already stored, so a replayed payload is not counted twice.
+    Returns the remaining samples, their latest fields and the number dropped.
+    """
+    stamped = {(s.metric_id, s.timestamp) for s, flag in zip(store_samples, client_stamped) if flag}
+    if not stamped:
+        return store_samples, latest_fields, 0
+    seen = storage.existing_samples({key[0] for key in stamped}, {key[1] for key in stamped})
+    kept_samples, kept_fields = [], []
+    for sample, fields, flag in zip(store_samples, latest_fields, client_stamped):
+        key = (sample.metric_id, sample.timestamp)
+        if flag:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept_samples.append(sample)
+        kept_fields.append(fields)
+    return kept_samples, kept_fields, len(store_samples) - len(kept_samples)
+
+
+def _stream_events(rows, metric_names):
+    """Shape committed readings like the items of GET /api/metrics, plus their reading_id."""
+    events = []
+    for row in rows:
+        device_name, metric_name = metric_names[row['metric_id']]
+        events.append({
+            'device': device_name,
+            'metric': metric_name,
+            'fields': row['fields'],
+            'timestamp': row['timestamp'].strftime("%Y-%m-%d %H:%M:%S"),
+            'metric_id': row['metric_id'],
+            'reading_id': row['reading_id']
+        })
+    return events
+
+
+def _ingest(envelopes):
+    started = time.perf_counter()
+    storage = get_storage()
+    stats = {
+        'storage': storage.name,
+        'envelopes': len(envelopes),
+        'duplicate_envelopes': [],
+        'duplicates': 0,
+        'metrics_created': 0,
+        'fields_created': 0,
+        'readings': 0,
+        'values': 0,
+        'schema_queries': 0,
+    }
+
+    now = datetime.utcnow()
+    # (device guid, metric name) -> definition staged by this transaction
+    pending = {}
+    store_samples = []
+    latest_fields = []
+    # Whether each sample carries a client timestamp (and is therefore deduplicated)
+    client_stamped = []
+    # metric_id -> (device friendly name, metric name), for the live stream
+    metric_names = {}
+    # Rows written to the latest_reading projection, published once committed
+    latest_rows = []
+    try:
+        duplicate_envelopes = _claim_receipts(envelopes)
+        stats['duplicate_envelopes'] = sorted(duplicate_envelopes)
+
+        for index, envelope in enumerate(envelopes):
+            if index in duplicate_envelopes:
+                continue
+            device = envelope.device
+            # Skip invalid metric data up front.
+            samples = _valid_samples(envelope.metrics)
+            if not samples:
+                continue
+
+            # metric name -> every field name it carries in this payload
+            wanted = {}
+            for metric_name, fields_data in samples:
+                wanted.setdefault(metric_name, set()).update(fields_data)
+            for metric_name in wanted:
+                pending.setdefault((device.guid, metric_name), None)
+
+            definitions = _stage_definitions(device, samples, wanted, pending, stats)
+            for metric_name in wanted:
+                pending[(device.guid, metric_name)] = definitions[metric_name]
+                metric_names[definitions[metric_name].metric_id] = (device.friendly_name, metric_name)
+
+            # DATETIME columns hold whole seconds, so client timestamps are truncated to
+            # compare equal to what is stored.
+            timestamp = envelope.timestamp.replace(microsecond=0) if envelope.timestamp else None
+            encoded, typed = _encode_samples(definitions, samples, timestamp or envelope.received_at or now)
+            store_samples.extend(encoded)
+            latest_fields.extend(typed)
+            client_stamped.extend([timestamp is not None] * len(encoded))
+
+        store_samples, latest_fields, stats['duplicates'] = _drop_duplicate_samples(
+            storage, store_samples, latest_fields, client_stamped
+        )
+        if store_samples:
+            reading_ids, stats['values'] = storage.insert_samples(store_samples)
+            stats['readings'] = len(reading_ids)
+
+            # Keep the latest_reading projection current in the same transaction.
+            latest_rows = [
+                {
+                    'metric_id': sample.metric_id,
+                    'reading_id': reading_id,
+                    'timestamp': sample.timestamp,
+                    'fields': fields
+                }
+                for reading_id, sample, fields in zip(reading_ids, store_samples, latest_fields)
+            ]
+            upsert_latest_readings(latest_rows)
 
-        # Record a ReadingValue for each defined field if provided.
-        for mf in metric.metric_fields:
-            if mf.field_name in fields_data:
-                rv = ReadingValue(
-                    reading_id=reading.id,
-                    metric_field_id=mf.id,
-                    value=str(fields_data[mf.field_name])
-                )
-                db.session.add(rv)
         db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for guid, metric_name in pending:
+            invalidate_metric_definition(guid, metric_name)
+        raise
+
+    # Only committed definitions are published to the cache.
+    for (guid, metric_name), definition in pending.items():
+        store_metric_definition(guid, metric_name, definition)
+    if stats['metrics_created'] or stats['fields_created']:
+        schema_snapshot.invalidate()
+    if latest_rows and metrics_broker.has_subscribers():
+        metrics_broker.publish(_stream_events(latest_rows, metric_names))
+
+    stats['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    logger.debug("Ingested %d envelope(s): %s", len(envelopes), stats)
+    return stats
+
+
+def ingest_envelopes(envelopes):
+    """
+    Process the metrics of several envelopes (see Envelope) in a single transaction.
+
+    The metrics and field definitions referenced by the payloads come from the definition
+    cache, falling back to one query per device for any that are missing or stale.
+    Missing metrics and fields are created, then one reading per metric is written through
+    the configured storage engine with a single insert for the whole batch. The
+    latest_reading projection is upserted in the same transaction before the only commit,
+    so either every envelope is stored or none is. Once committed, the new readings are
+    published to the live metrics stream.
+
+    Envelopes whose idempotency key was already ingested are skipped (reported in
+    'duplicate_envelopes'), as are client-stamped samples already stored for the same
+    metric and timestamp (counted in 'duplicates'). If a concurrent request commits the same
+    key or schema row first, the batch is retried once and the duplicates are then skipped.
+
+    Returns a dictionary of row counts and the elapsed time for the batch.
+    """
+    try:
+        return _ingest(envelopes)
+    except IntegrityError:
+        logger.info("Ingest of %d envelope(s) conflicted with a concurrent write; retrying", len(envelopes))
+        return _ingest(envelopes)
+
+
+def process_metrics(device, metrics_list):
+    """
+    Process a list of metrics for the given device in a single transaction.
+
+    `device` is anything with `id`, `guid` and `friendly_name` attributes (a Device or a
+    cached DeviceRef).
+    See ingest_envelopes. Returns a dictionary of row counts and the elapsed time for the request.
+    """
+    return ingest_envelopes([Envelope(device, metrics_list)])
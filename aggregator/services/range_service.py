@@ -0,0 +1,149 @@
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from aggregator.models import MetricField
+from aggregator.services.rollup_service import get_rollup_buckets, get_watermark, merge_bucket, select_tier
+from aggregator.storage import get_storage
+
+BUCKET_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+SUPPORTED_AGGREGATES = ('avg', 'min', 'max', 'count', 'last')
+# Upper bound on the number of buckets a single range request may produce
+MAX_BUCKETS = 5000
+DEFAULT_RANGE = timedelta(days=1)
+
+
+def parse_bucket(spec):
+    """
+    Parse a bucket size such as '30s', '1m', '5m', '1h' or '1d' into seconds.
+
+    Raises:
+        ValueError: If the bucket specification is invalid.
+    """
+    match = re.fullmatch(r'(\d+)([smhd])', (spec or '').strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid bucket '{spec}', expected e.g. 30s, 1m, 1h or 1d")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+
+def parse_aggregates(spec):
+    """
+    Parse a comma separated list of aggregates (e.g. 'avg,min,max,last').
+
+    Raises:
+        ValueError: If an aggregate is not supported.
+    """
+    aggregates = [a.strip().lower() for a in (spec or '').split(',') if a.strip()]
+    if not aggregates:
+        raise ValueError("At least one aggregate is required")
+    unknown = [a for a in aggregates if a not in SUPPORTED_AGGREGATES]
+    if unknown:
+        raise ValueError(f"Unsupported aggregate(s): {', '.join(unknown)}")
+    return list(OrderedDict.fromkeys(aggregates))
+
+
+def parse_time(value):
+    """
+    Parse an ISO 8601 timestamp or a UNIX epoch (seconds) into a naive UTC datetime.
+
+    Raises:
+        ValueError: If the value cannot be parsed.
+    """
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except (TypeError, ValueError, OverflowError, OSError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid timestamp '{value}'")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def numeric_fields(metric_id):
+    """Return the numeric field definitions of a metric, ordered by field index."""
+    return (
+        MetricField.query
+        .filter_by(metric_id=metric_id, field_type='numeric')
+        .order_by(MetricField.field_index)
+        .all()
+    )
+
+
+def _raw_buckets(storage, metric_id, fields, start, end, bucket_seconds, after_reading_id=0):
+    """Aggregate raw readings through the storage engine; see ReadingStore.numeric_buckets."""
+    buckets = storage.numeric_buckets(metric_id, fields, start, end, bucket_seconds, after_reading_id)
+    # A bucket whose newest reading lacks the field never wins 'last' when merged.
+    for entry in buckets.values():
+        if entry['last_timestamp'] is None:
+            entry['last_timestamp'] = datetime.min
+    return buckets
+
+
+def _finalize(bucket, aggregate):
+    if aggregate == 'avg':
+        return bucket['sum'] / bucket['count'] if bucket['count'] else None
+    return bucket[aggregate]
+
+
+def get_metric_range(metric_id, start=None, end=None, bucket_seconds=60, aggregates=('avg',)):
+    """
+    Return the numeric fields of a metric between start (inclusive) and end (exclusive),
+    aggregated server-side into fixed-size time buckets.
+
+    The coarsest rollup tier that evenly divides the bucket size (and still retains the
+    start of the range) is used, topped up with raw readings above the rollup watermark.
+    Otherwise raw readings are aggregated directly. The response size is bounded by the
+    number of buckets rather than the number of raw readings. Empty buckets are omitted.
+
+    Raises:
+        ValueError: If the range is empty or would produce more than MAX_BUCKETS buckets.
+    """
+    end = end or datetime.utcnow()
+    start = start or end - DEFAULT_RANGE
+    if start >= end:
+        raise ValueError("start must be before end")
+    if (end - start).total_seconds() / bucket_seconds > MAX_BUCKETS:
+        raise ValueError(f"Range would produce more than {MAX_BUCKETS} buckets; use a larger bucket")
+
+    storage = get_storage()
+    fields = numeric_fields(metric_id)
+    resolution = select_tier(bucket_seconds, start)
+    buckets = {}
+    if fields:
+        if resolution is None:
+            buckets = _raw_buckets(storage, metric_id, fields, start, end, bucket_seconds)
+        else:
+            field_ids = [mf.id for mf in fields]
+            buckets = get_rollup_buckets(metric_id, field_ids, start, end, resolution, bucket_seconds)
+            tail = _raw_buckets(
+                storage, metric_id, fields, start, end, bucket_seconds, after_reading_id=get_watermark()
+            )
+            for key, bucket in tail.items():
+                if key in buckets:
+                    merge_bucket(buckets[key], bucket)
+                else:
+                    buckets[key] = bucket
+
+    series = OrderedDict()
+    for mf in fields:
+        points = []
+        for (epoch, field_id), bucket in sorted(buckets.items()):
+            if field_id != mf.id:
+                continue
+            point = {'timestamp': datetime.utcfromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")}
+            for aggregate in aggregates:
+                point[aggregate] = _finalize(bucket, aggregate)
+            points.append(point)
+        series[mf.field_name] = points
+
+    return {
+        'metric_id': metric_id,
+        'start': start.strftime("%Y-%m-%d %H:%M:%S"),
+        'end': end.strftime("%Y-%m-%d %H:%M:%S"),
+        'bucket_seconds': bucket_seconds,
+        'source': f"rollup_{resolution}s" if resolution else 'raw',
+        'aggregates': list(aggregates),
+        'fields': series
+    }
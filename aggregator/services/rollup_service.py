@@ -0,0 +1,266 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from aggregator.config import Config
+from aggregator.models import db, IngestReceipt, ReadingRollup, RollupWatermark
+from aggregator.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Rollup tiers: resolution in seconds -> retention in days (None keeps them forever)
+TIERS = OrderedDict([
+    (60, Config.ROLLUP_1M_RETENTION_DAYS),
+    (3600, Config.ROLLUP_1H_RETENTION_DAYS),
+    (86400, Config.ROLLUP_1D_RETENTION_DAYS),
+])
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(timestamp):
+    return int((timestamp - EPOCH).total_seconds())
+
+
+def floor_timestamp(timestamp, resolution):
+    """Start of the bucket of the given resolution (seconds) containing the timestamp."""
+    seconds = to_epoch(timestamp)
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def new_bucket(value, timestamp):
+    """Accumulator for one bucket; rollup rows, raw aggregates and range results share it."""
+    return {'count': 1, 'sum': value, 'min': value, 'max': value, 'last': value, 'last_timestamp': timestamp}
+
+
+def merge_bucket(target, other):
+    """Fold the accumulator `other` into `target`."""
+    target['count'] += other['count']
+    target['sum'] += other['sum']
+    target['min'] = min(target['min'], other['min'])
+    target['max'] = max(target['max'], other['max'])
+    if other['last_timestamp'] >= target['last_timestamp']:
+        target['last'] = other['last']
+        target['last_timestamp'] = other['last_timestamp']
+
+
+def _watermark_name():
+    """Each storage engine has its own reading ids, so the watermark is kept per reading table."""
+    return get_storage().table_name
+
+
+def get_watermark():
+    """Highest reading id already folded into the rollups (0 if rollups never ran)."""
+    watermark = RollupWatermark.query.filter_by(name=_watermark_name()).first()
+    return watermark.last_reading_id if watermark else 0
+
+
+def _lock_watermark():
+    """Load the watermark row for update (creating it if needed) so concurrent runs serialize."""
+    name = _watermark_name()
+    watermark = RollupWatermark.query.filter_by(name=name).with_for_update().first()
+    if watermark is None:
+        watermark = RollupWatermark(name=name, last_reading_id=0)
+        db.session.add(watermark)
+        db.session.flush()
+    return watermark
+
+
+def _store_buckets(buckets):
+    """
+    Merge accumulated buckets, keyed by (resolution, metric_field_id, bucket_start), into
+    reading_rollup. Existing rows are loaded with one query per tier and updated in place.
+    """
+    by_resolution = {}
+    for key in buckets:
+        by_resolution.setdefault(key[0], []).append(key)
+
+    for resolution, keys in by_resolution.items():
+        existing = {
+            (row.resolution, row.metric_field_id, row.bucket_start): row
+            for row in ReadingRollup.query.filter(
+                ReadingRollup.resolution == resolution,
+                ReadingRollup.metric_field_id.in_({key[1] for key in keys}),
+                ReadingRollup.bucket_start >= min(key[2] for key in keys),
+                ReadingRollup.bucket_start <= max(key[2] for key in keys)
+            )
+        }
+        for key in keys:
+            metric_id, bucket = buckets[key]
+            row = existing.get(key)
+            if row is None:
+                db.session.add(ReadingRollup(
+                    resolution=resolution,
+                    metric_field_id=key[1],
+                    bucket_start=key[2],
+                    metric_id=metric_id,
+                    count=bucket['count'],
+                    min_value=bucket['min'],
+                    max_value=bucket['max'],
+                    sum_value=bucket['sum'],
+                    last_value=bucket['last'],
+                    last_timestamp=bucket['last_timestamp']
+                ))
+                continue
+            merged = {
+                'count': row.count, 'sum': row.sum_value, 'min': row.min_value, 'max': row.max_value,
+                'last': row.last_value, 'last_timestamp': row.last_timestamp
+            }
+            merge_bucket(merged, bucket)
+            row.count = merged['count']
+            row.sum_value = merged['sum']
+            row.min_value = merged['min']
+            row.max_value = merged['max']
+            row.last_value = merged['last']
+            row.last_timestamp = merged['last_timestamp']
+
+
+def run_rollups(batch_size=None, settle_seconds=None):
+    """
+    Fold the numeric values of readings newer than the watermark into every rollup tier.
+
+    Readings are processed in id order, batch_size at a time. Each batch is merged into
+    reading_rollup and the watermark advanced in the same transaction, so an interrupted run
+    never double counts.
+
+    The watermark only passes reading ids that have settled (see ReadingStore.max_reading_id):
+    a run records the highest reading id as a horizon, and later runs fold readings up to it
+    once it is settle_seconds old (default ROLLUP_SETTLE_SECONDS). Readings above the
+    watermark are served raw by range queries.
+    Returns the number of readings processed.
+    """
+    batch_size = batch_size or Config.ROLLUP_BATCH_SIZE
+    settle = timedelta(seconds=Config.ROLLUP_SETTLE_SECONDS if settle_seconds is None else settle_seconds)
+    storage = get_storage()
+    processed = 0
+    while True:
+        try:
+            watermark = _lock_watermark()
+            now = datetime.utcnow()
+            settled = watermark.horizon_at is None or watermark.horizon_at <= now - settle
+            horizon = (watermark.horizon_reading_id or 0) if settled else watermark.last_reading_id
+            ids = storage.reading_ids_after(watermark.last_reading_id, batch_size, upper_id=horizon)
+            if not ids:
+                if not settled:
+                    db.session.commit()
+                    break
+                # Every reading up to the horizon is folded; record the next one.
+                watermark.last_reading_id = max(watermark.last_reading_id, horizon)
+                watermark.horizon_reading_id = storage.max_reading_id()
+                watermark.horizon_at = now
+                db.session.commit()
+                if settle or watermark.horizon_reading_id <= watermark.last_reading_id:
+                    break
+                continue
+            upper = ids[-1]
+
+            # (resolution, metric_field_id, bucket_start) -> (metric_id, accumulator)
+            buckets = {}
+            for metric_id, timestamp, field_id, value in storage.numeric_values_between(
+                watermark.last_reading_id, upper
+            ):
+                for resolution in TIERS:
+                    key = (resolution, field_id, floor_timestamp(timestamp, resolution))
+                    if key in buckets:
+                        merge_bucket(buckets[key][1], new_bucket(value, timestamp))
+                    else:
+                        buckets[key] = (metric_id, new_bucket(value, timestamp))
+            _store_buckets(buckets)
+
+            watermark.last_reading_id = upper
+            watermark.updated_at = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        processed += len(ids)
+        logger.info("Rolled up %d readings (watermark %d)", len(ids), upper)
+    return processed
+
+
+def apply_retention(raw_days=None, batch_size=None):
+    """
+    Delete raw readings older than raw_days, batch_size readings per transaction. Readings
+    not yet folded into the rollups (above the watermark) are never deleted. Rollup tiers
+    are then trimmed to their own retention, and expired idempotency keys are forgotten.
+    Returns the number of readings, rollup rows and idempotency receipts deleted.
+    """
+    raw_days = raw_days if raw_days is not None else Config.RAW_RETENTION_DAYS
+    batch_size = batch_size or Config.RETENTION_BATCH_SIZE
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=raw_days)
+    storage = get_storage()
+    watermark = get_watermark()
+
+    deleted_readings = 0
+    while True:
+        ids = storage.expired_reading_ids(cutoff, watermark, batch_size)
+        if not ids:
+            break
+        storage.delete_readings(ids)
+        db.session.commit()
+        deleted_readings += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    deleted_rollups = 0
+    for resolution, days in TIERS.items():
+        if days is None:
+            continue
+        deleted_rollups += ReadingRollup.query.filter(
+            ReadingRollup.resolution == resolution,
+            ReadingRollup.bucket_start < now - timedelta(days=days)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    deleted_receipts = IngestReceipt.query.filter(
+        IngestReceipt.created_at < now - timedelta(hours=Config.IDEMPOTENCY_KEY_RETENTION_HOURS)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    return {'readings': deleted_readings, 'rollups': deleted_rollups, 'receipts': deleted_receipts}
+
+
+def select_tier(bucket_seconds, start, now=None):
+    """
+    Return the coarsest rollup resolution that evenly divides bucket_seconds and still
+    retains data at `start`, or None if raw readings must be used.
+    """
+    now = now or datetime.utcnow()
+    for resolution, days in reversed(TIERS.items()):
+        if bucket_seconds % resolution:
+            continue
+        if days is not None and start < now - timedelta(days=days):
+            continue
+        return resolution
+    return None
+
+
+def get_rollup_buckets(metric_id, field_ids, start, end, resolution, bucket_seconds):
+    """
+    Re-aggregate rollup rows of one tier into buckets of bucket_seconds (a multiple of the
+    resolution). Range boundaries are aligned to the tier resolution.
+    Returns a dictionary of (bucket epoch, field id) -> accumulator.
+    """
+    rows = (
+        ReadingRollup.query
+        .filter(
+            ReadingRollup.metric_id == metric_id,
+            ReadingRollup.resolution == resolution,
+            ReadingRollup.metric_field_id.in_(field_ids),
+            ReadingRollup.bucket_start >= floor_timestamp(start, resolution),
+            ReadingRollup.bucket_start < end
+        )
+        .all()
+    )
+    buckets = {}
+    for row in rows:
+        epoch = to_epoch(row.bucket_start)
+        key = (epoch - epoch % bucket_seconds, row.metric_field_id)
+        bucket = {
+            'count': row.count, 'sum': row.sum_value, 'min': row.min_value, 'max': row.max_value,
+            'last': row.last_value, 'last_timestamp': row.last_timestamp
+        }
+        if key in buckets:
+            merge_bucket(buckets[key], bucket)
+        else:
+            buckets[key] = bucket
+    return buckets
@@ -1,11 +1,15 @@
-from aggregator.models import Device
+from sqlalchemy.orm import selectinload
+from aggregator.models import Device, Metric
 
 def get_schema():
     """
     Returns the current schema as a list of devices.
     Each device includes its metrics and each metric its field definitions.
+    Metrics and fields are eager-loaded, so the schema costs three queries in total.
     """
-    devices = Device.query.all()
+    devices = Device.query.options(
+        selectinload(Device.metrics).selectinload(Metric.metric_fields)
+    ).all()
     schema = []
     for device in devices:
         device_entry = {
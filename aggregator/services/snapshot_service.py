@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import deque
+from aggregator.config import Config
+from aggregator.services.metrics_query_service import get_latest_metrics
+from aggregator.services.schema_service import get_schema
+
+
+class Snapshot:
+    """
+    A process-wide cached result of `loader`, recomputed at most once per `ttl` seconds.
+
+    Refreshes are single-flight: when the snapshot is stale, one caller runs the loader while
+    concurrent callers wait for it and share its result, so the database load does not grow
+    with the number of dashboards or API clients polling. Callers must treat the returned
+    value as read-only. The loader runs in the caller's app context.
+    """
+
+    def __init__(self, name, loader, ttl):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.refreshes = 0
+        self._value = None
+        self._loaded_at = None
+        self._refresh_lock = threading.Lock()
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def get(self):
+        if self._fresh():
+            return self._value
+        with self._refresh_lock:
+            # Another caller may have refreshed the snapshot while this one waited.
+            if not self._fresh():
+                self._value = self.loader()
+                self._loaded_at = time.monotonic()
+                self.refreshes += 1
+            return self._value
+
+    def invalidate(self):
+        """Force the next get() to reload, e.g. after the underlying data changed shape."""
+        self._loaded_at = None
+
+
+class SettledHorizon:
+    """
+    The highest reading id that has settled (see ReadingStore.max_reading_id): the newest one
+    observed at least `window` seconds ago. Observations older than that are folded into it.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._settled = 0
+        self._observed = deque()  # (monotonic time, highest reading id), oldest first
+        self._lock = threading.Lock()
+
+    def _fold(self, now):
+        while self._observed and self._observed[0][0] <= now - self.window:
+            self._settled = max(self._settled, self._observed.popleft()[1])
+
+    def observe(self, reading_id):
+        now = time.monotonic()
+        with self._lock:
+            self._fold(now)
+            self._observed.append((now, reading_id))
+
+    def get(self):
+        with self._lock:
+            self._fold(time.monotonic())
+            return self._settled
+
+
+def _load_latest():
+    metrics = get_latest_metrics()
+    latest_horizon.observe(max((item['reading_id'] for item in metrics), default=0))
+    return metrics
+
+
+# A snapshot may be served up to SNAPSHOT_TTL_SECONDS after it was loaded, so an id must have
+# settled that much longer for every snapshot served from now on to include what it settles.
+latest_horizon = SettledHorizon(Config.METRICS_CURSOR_SETTLE_SECONDS + Config.SNAPSHOT_TTL_SECONDS)
+latest_snapshot = Snapshot('latest', _load_latest, Config.SNAPSHOT_TTL_SECONDS)
+schema_snapshot = Snapshot('schema', get_schema, Config.SNAPSHOT_TTL_SECONDS)
+
+
+def latest_changes(since):
+    """
+    Return the latest metrics whose reading changed after cursor `since`, and the new cursor.
+
+    The cursor is the settled reading id horizon of this process (or `since`, if that is
+    higher), so it trails the newest readings by METRICS_CURSOR_SETTLE_SECONDS: a metric can
+    be returned by consecutive calls, but none is skipped. Each call is served from the
+    shared snapshot, without a query per caller.
+    """
+    # Read the horizon first: the snapshot served next was loaded no earlier than that.
+    cursor = max(latest_horizon.get(), since)
+    metrics = latest_snapshot.get()
+    changed = [item for item in metrics if item['reading_id'] > since]
+    return changed, cursor
@@ -0,0 +1,119 @@
+import json
+import threading
+from aggregator.config import Config
+
+
+class TooManySubscribers(Exception):
+    """Raised by MetricsBroker.subscribe when the subscriber limit is reached."""
+
+
+def _frame(event):
+    """Encode a reading event as one Server-Sent Events message."""
+    return f"id: {event['reading_id']}\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscription:
+    """
+    One stream client: its filters and a bounded buffer of encoded events.
+
+    `devices`, `metrics` and `metric_ids` are sets of device friendly names, metric names and
+    metric ids; an empty set matches everything. When more than `maxsize` events are waiting
+    the subscriber is too slow to keep up, so it is marked dropped and receives nothing more.
+    """
+
+    def __init__(self, devices=None, metrics=None, metric_ids=None, maxsize=500):
+        self.devices = set(devices or ())
+        self.metrics = set(metrics or ())
+        self.metric_ids = set(metric_ids or ())
+        self.maxsize = maxsize
+        self.dropped = False
+        self._buffer = []
+        self._ready = threading.Condition()
+
+    def matches(self, event):
+        return (
+            (not self.devices or event['device'] in self.devices)
+            and (not self.metrics or event['metric'] in self.metrics)
+            and (not self.metric_ids or event['metric_id'] in self.metric_ids)
+        )
+
+    def push(self, frames):
+        """Buffer encoded events. Returns False if the subscriber was dropped."""
+        with self._ready:
+            if self.dropped:
+                return False
+            if len(self._buffer) + len(frames) > self.maxsize:
+                self.dropped = True
+            else:
+                self._buffer.extend(frames)
+            self._ready.notify()
+            return not self.dropped
+
+    def get(self, timeout):
+        """
+        Wait up to `timeout` seconds for events and return every buffered one (an empty list
+        on timeout). Events buffered before the subscriber was dropped are still returned.
+        """
+        with self._ready:
+            self._ready.wait_for(lambda: self._buffer or self.dropped, timeout)
+            frames, self._buffer = self._buffer, []
+            return frames
+
+
+class MetricsBroker:
+    """
+    In-process publish/subscribe of newly ingested readings for the metrics stream.
+
+    Ingest publishes each committed batch once; every event is encoded a single time and
+    handed to the subscribers whose filters match it, without blocking on any of them.
+    Only subscribers in the process that ingested a reading see it.
+    """
+
+    def __init__(self, buffer_size, max_subscribers):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.published = 0
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, devices=None, metrics=None, metric_ids=None):
+        """
+        Raises:
+            TooManySubscribers: If max_subscribers streams are already open.
+        """
+        subscription = Subscription(devices, metrics, metric_ids, self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"At most {self.max_subscribers} streams may be open at once")
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, events):
+        """Deliver reading events (dictionaries shaped like /api/metrics items) to matching subscribers."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers or not events:
+            return
+        encoded = [(event, _frame(event)) for event in events]
+        for subscription in subscribers:
+            frames = [frame for event, frame in encoded if subscription.matches(event)]
+            if frames and not subscription.push(frames):
+                self.unsubscribe(subscription)
+                self.dropped += 1
+        self.published += len(events)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {"subscribers": subscribers, "published": self.published, "dropped": self.dropped}
+
+
+metrics_broker = MetricsBroker(Config.STREAM_BUFFER_SIZE, Config.STREAM_MAX_SUBSCRIBERS)
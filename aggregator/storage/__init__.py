@@ -0,0 +1,21 @@
+from aggregator.config import Config
+from aggregator.storage.base import ReadingStore, Sample
+from aggregator.storage.eav import EAVReadingStore
+from aggregator.storage.wide import WideReadingStore
+
+_ENGINES = {
+    EAVReadingStore.name: EAVReadingStore(),
+    WideReadingStore.name: WideReadingStore(),
+}
+
+
+def get_storage(name=None):
+    """
+    Return the reading storage engine with the given name, defaulting to the configured
+    READING_STORAGE ('eav' or 'wide').
+    """
+    name = name or Config.READING_STORAGE
+    try:
+        return _ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown reading storage engine '{name}'")
@@ -0,0 +1,198 @@
+from collections import OrderedDict, namedtuple
+from sqlalchemy import Integer, and_, cast, func, literal_column, or_
+from aggregator.models import db
+
+# One sample to store: values is a list of (FieldRef, value, numeric_value) tuples
+Sample = namedtuple('Sample', ['metric_id', 'timestamp', 'values'])
+
+
+def epoch_seconds(column):
+    """Dialect-specific expression for the UNIX epoch seconds of a naive UTC DATETIME column."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        # TIMESTAMPDIFF ignores the session time zone, unlike UNIX_TIMESTAMP.
+        return func.timestampdiff(literal_column('SECOND'), '1970-01-01 00:00:00', column)
+    if dialect == 'sqlite':
+        return cast(func.strftime('%s', column), Integer)
+    if dialect == 'postgresql':
+        return cast(func.extract('epoch', column), Integer)
+    raise NotImplementedError(f"Range queries are not supported on {dialect}")
+
+
+def bucket_start(column, bucket_seconds):
+    """Expression for the epoch second at which the bucket containing `column` starts."""
+    epoch = epoch_seconds(column)
+    return epoch - (epoch % bucket_seconds)
+
+
+def empty_bucket():
+    """Accumulator returned by numeric_buckets; 'last' is filled in separately."""
+    return {'count': 0, 'sum': None, 'min': None, 'max': None, 'last': None, 'last_timestamp': None}
+
+
+def to_number(value):
+    return float(value) if value is not None else None
+
+
+def insert_rows(table, rows):
+    """
+    Insert rows (dictionaries with the same keys) into a table with an auto-increment id,
+    inside the caller's transaction. Returns the new ids, in row order.
+    """
+    dialect = db.session.get_bind().dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        return list(db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars())
+    if dialect.name == 'mysql':
+        # No RETURNING: a single multi-row INSERT, whose LAST_INSERT_ID() is the id of its
+        # first row. A multi-row INSERT ... VALUES is a "simple insert", which InnoDB gives one
+        # consecutive block of ids under every innodb_autoinc_lock_mode (with the default
+        # auto_increment_increment of 1), so the other ids follow from it.
+        first_id = db.session.execute(table.insert().values(rows)).lastrowid
+        return list(range(first_id, first_id + len(rows)))
+    return [db.session.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+
+class ReadingStore:
+    """
+    Storage engine for raw readings.
+
+    The ingest, history, latest, range and rollup services go through the active engine
+    (see aggregator.storage.get_storage) rather than querying reading tables directly, so the
+    layout can be switched and both layouts benchmarked on the same dataset. Every engine
+    keeps one row per sample in `model`, with `id`, `metric_id` and `timestamp` columns.
+    """
+    name = None
+    model = None
+
+    @property
+    def table_name(self):
+        return self.model.__tablename__
+
+    # Engine-specific operations
+
+    def insert_samples(self, samples):
+        """
+        Insert samples inside the caller's transaction (no commit).
+        Returns the new reading ids, in sample order, and the number of values written.
+        """
+        raise NotImplementedError
+
+    def load_values(self, reading_ids):
+        """Return {reading_id: [(field_index, field_name, typed value), ...]} for the readings."""
+        raise NotImplementedError
+
+    def numeric_buckets(self, metric_id, fields, start, end, bucket_seconds, after_reading_id=0):
+        """
+        Aggregate the numeric fields (MetricField rows) of a metric into time buckets in the
+        database, optionally only for readings with an id above after_reading_id.
+        Returns {(bucket epoch, field id): accumulator}.
+        """
+        raise NotImplementedError
+
+    def numeric_values_between(self, lower_id, upper_id):
+        """Return (metric_id, timestamp, metric_field_id, value) for numeric values of readings in (lower_id, upper_id]."""
+        raise NotImplementedError
+
+    def delete_readings(self, reading_ids):
+        """Delete the given readings and their values (no commit)."""
+        raise NotImplementedError
+
+    # Operations shared by every layout
+
+    def history_query(self, metric_id):
+        """Query of (id, timestamp) for every reading of a metric."""
+        return db.session.query(self.model.id, self.model.timestamp).filter(self.model.metric_id == metric_id)
+
+    def existing_samples(self, metric_ids, timestamps):
+        """The (metric_id, timestamp) pairs already stored among the given metrics and timestamps."""
+        rows = (
+            db.session.query(self.model.metric_id, self.model.timestamp)
+            .filter(self.model.metric_id.in_(metric_ids), self.model.timestamp.in_(timestamps))
+            .all()
+        )
+        return {(row.metric_id, row.timestamp) for row in rows}
+
+    def reading_ids_after(self, lower_id, limit, upper_id=None):
+        """Ids of the next `limit` readings above lower_id (and at most upper_id), in id order."""
+        query = db.session.query(self.model.id).filter(self.model.id > lower_id)
+        if upper_id is not None:
+            query = query.filter(self.model.id <= upper_id)
+        return [row.id for row in query.order_by(self.model.id).limit(limit).all()]
+
+    def max_reading_id(self):
+        """
+        Highest reading id stored (0 if there are none).
+
+        Reading ids are allocated before the inserting transaction commits, so a reading with
+        a lower id can still become visible after this returns. Whatever tracks progress by
+        reading id (the rollup watermark, the metrics cursor) therefore only moves past an id
+        once it has settled: once it was already the highest id longer ago than any ingest
+        transaction lasts.
+        """
+        return db.session.query(func.max(self.model.id)).scalar() or 0
+
+    def expired_reading_ids(self, cutoff, max_id, limit):
+        """Ids of up to `limit` readings older than cutoff with an id of at most max_id."""
+        return [
+            row.id for row in
+            db.session.query(self.model.id)
+            .filter(self.model.id <= max_id, self.model.timestamp < cutoff)
+            .order_by(self.model.id)
+            .limit(limit)
+            .all()
+        ]
+
+    def latest_samples(self, metric_ids):
+        """
+        Return the newest reading of each given metric (groupwise max on timestamp, ties
+        broken on the highest id) as latest_reading rows.
+        """
+        model = self.model
+        latest_ts = (
+            db.session.query(model.metric_id, func.max(model.timestamp).label('timestamp'))
+            .filter(model.metric_id.in_(metric_ids))
+            .group_by(model.metric_id)
+            .subquery()
+        )
+        latest_ids = (
+            db.session.query(func.max(model.id).label('reading_id'))
+            .join(latest_ts, and_(
+                model.metric_id == latest_ts.c.metric_id,
+                model.timestamp == latest_ts.c.timestamp
+            ))
+            .group_by(model.metric_id)
+            .subquery()
+        )
+        readings = (
+            db.session.query(model.id, model.metric_id, model.timestamp)
+            .join(latest_ids, model.id == latest_ids.c.reading_id)
+            .all()
+        )
+        values = self.load_values([r.id for r in readings]) if readings else {}
+        return [
+            {
+                'metric_id': r.metric_id,
+                'reading_id': r.id,
+                'timestamp': r.timestamp,
+                'fields': OrderedDict((name, value) for _, name, value in sorted(values.get(r.id, [])))
+            }
+            for r in readings
+        ]
+
+    def _in_range(self, metric_id, start, end, after_reading_id):
+        return and_(
+            self.model.metric_id == metric_id,
+            self.model.timestamp >= start,
+            self.model.timestamp < end,
+            self.model.id > after_reading_id
+        )
+
+    def _at_timestamps(self, metric_id, timestamps, after_reading_id):
+        """Condition matching the metric's readings (above after_reading_id) at any of the given timestamps."""
+        return and_(
+            self.model.metric_id == metric_id,
+            or_(*(self.model.timestamp == timestamp for timestamp in timestamps)),
+            self.model.id > after_reading_id
+        )
@@ -0,0 +1,129 @@
+from sqlalchemy import and_, func
+from aggregator.models import db, MetricField, Reading, ReadingValue
+from aggregator.services.field_values import decode_value
+from aggregator.storage.base import ReadingStore, bucket_start, empty_bucket, insert_rows, to_number
+
+
+class EAVReadingStore(ReadingStore):
+    """
+    The original layout: one `reading` row per sample plus one `reading_value` row per
+    field, resolved through `metric_field`.
+    """
+    name = 'eav'
+    model = Reading
+
+    def insert_samples(self, samples):
+        # Readings, then their values, each go out as one multi-row INSERT.
+        reading_ids = insert_rows(Reading.__table__, [
+            {'metric_id': s.metric_id, 'timestamp': s.timestamp} for s in samples
+        ])
+        value_rows = [
+            {
+                'reading_id': reading_id,
+                'metric_field_id': field.id,
+                'value': value,
+                'numeric_value': numeric_value
+            }
+            for reading_id, sample in zip(reading_ids, samples)
+            for field, value, numeric_value in sample.values
+        ]
+        if value_rows:
+            db.session.execute(ReadingValue.__table__.insert(), value_rows)
+        return reading_ids, len(value_rows)
+
+    def load_values(self, reading_ids):
+        rows = (
+            db.session.query(
+                ReadingValue.reading_id,
+                ReadingValue.value,
+                ReadingValue.numeric_value,
+                MetricField.field_index,
+                MetricField.field_name
+            )
+            .join(MetricField, MetricField.id == ReadingValue.metric_field_id)
+            .filter(ReadingValue.reading_id.in_(reading_ids))
+            .all()
+        )
+        values = {}
+        for rv in rows:
+            values.setdefault(rv.reading_id, []).append(
+                (rv.field_index, rv.field_name, decode_value(rv.value, rv.numeric_value))
+            )
+        return values
+
+    def numeric_buckets(self, metric_id, fields, start, end, bucket_seconds, after_reading_id=0):
+        bucket = bucket_start(Reading.timestamp, bucket_seconds).label('bucket')
+        value = ReadingValue.numeric_value
+        field_ids = [mf.id for mf in fields]
+        in_range = self._in_range(metric_id, start, end, after_reading_id)
+
+        rows = (
+            db.session.query(
+                bucket,
+                ReadingValue.metric_field_id,
+                func.count(value).label('count'),
+                func.sum(value).label('sum'),
+                func.min(value).label('min'),
+                func.max(value).label('max')
+            )
+            .select_from(Reading)
+            .join(ReadingValue, ReadingValue.reading_id == Reading.id)
+            .filter(in_range, ReadingValue.metric_field_id.in_(field_ids), value.isnot(None))
+            .group_by(bucket, ReadingValue.metric_field_id)
+            .all()
+        )
+        buckets = {}
+        for row in rows:
+            entry = buckets[(int(row.bucket), row.metric_field_id)] = empty_bucket()
+            entry.update(count=row.count, sum=to_number(row.sum), min=to_number(row.min), max=to_number(row.max))
+        if not buckets:
+            return buckets
+
+        # Groupwise max per (bucket, field) over the readings that carry a value for the
+        # field, so a newer reading without it does not hide the field's last value.
+        last_ts = (
+            db.session.query(bucket, ReadingValue.metric_field_id, func.max(Reading.timestamp).label('timestamp'))
+            .select_from(Reading)
+            .join(ReadingValue, ReadingValue.reading_id == Reading.id)
+            .filter(in_range, ReadingValue.metric_field_id.in_(field_ids), value.isnot(None))
+            .group_by(bucket, ReadingValue.metric_field_id)
+            .subquery()
+        )
+        last_rows = (
+            db.session.query(last_ts.c.bucket, Reading.timestamp, ReadingValue.metric_field_id, value.label('value'))
+            .join(Reading, self._at_timestamps(metric_id, [last_ts.c.timestamp], after_reading_id))
+            .join(ReadingValue, and_(
+                ReadingValue.reading_id == Reading.id,
+                ReadingValue.metric_field_id == last_ts.c.metric_field_id
+            ))
+            .filter(value.isnot(None))
+            .order_by(Reading.id)
+            .all()
+        )
+        for row in last_rows:
+            entry = buckets.get((int(row.bucket), row.metric_field_id))
+            if entry is not None:
+                entry['last'] = to_number(row.value)
+                entry['last_timestamp'] = row.timestamp
+        return buckets
+
+    def numeric_values_between(self, lower_id, upper_id):
+        return (
+            db.session.query(
+                Reading.metric_id,
+                Reading.timestamp,
+                ReadingValue.metric_field_id,
+                ReadingValue.numeric_value
+            )
+            .join(ReadingValue, ReadingValue.reading_id == Reading.id)
+            .filter(
+                Reading.id > lower_id,
+                Reading.id <= upper_id,
+                ReadingValue.numeric_value.isnot(None)
+            )
+            .all()
+        )
+
+    def delete_readings(self, reading_ids):
+        ReadingValue.query.filter(ReadingValue.reading_id.in_(reading_ids)).delete(synchronize_session=False)
+        Reading.query.filter(Reading.id.in_(reading_ids)).delete(synchronize_session=False)
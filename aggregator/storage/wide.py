@@ -0,0 +1,122 @@
+from sqlalchemy import and_, case, func
+from aggregator.models import db, MetricField, WideReading
+from aggregator.services.field_values import decode_value
+from aggregator.storage.base import ReadingStore, bucket_start, empty_bucket, insert_rows, to_number
+
+
+def numeric_slot(field_index):
+    return getattr(WideReading, f'num_{field_index}')
+
+
+class WideReadingStore(ReadingStore):
+    """
+    Columnar layout: each sample is a single `reading_wide` row whose typed slot columns
+    (num_N / str_N) hold the value of the field with field_index N. A sample costs one row
+    instead of one plus one per field, and needs no join to be rebuilt.
+    """
+    name = 'wide'
+    model = WideReading
+
+    def insert_samples(self, samples):
+        # Every row sets every slot, so the rows share one column list for a multi-row INSERT.
+        empty_slots = {f'{kind}_{index}': None for index in range(1, 6) for kind in ('num', 'str')}
+        rows = []
+        values_written = 0
+        for sample in samples:
+            row = dict(empty_slots, metric_id=sample.metric_id, timestamp=sample.timestamp)
+            for field, value, numeric_value in sample.values:
+                row[f'num_{field.field_index}'] = numeric_value
+                row[f'str_{field.field_index}'] = value
+                values_written += 1
+            rows.append(row)
+        return insert_rows(WideReading.__table__, rows), values_written
+
+    def load_values(self, reading_ids):
+        rows = (
+            db.session.query(WideReading, MetricField.field_index, MetricField.field_name)
+            .join(MetricField, MetricField.metric_id == WideReading.metric_id)
+            .filter(WideReading.id.in_(reading_ids))
+            .all()
+        )
+        values = {}
+        for reading, field_index, field_name in rows:
+            value = getattr(reading, f'str_{field_index}')
+            numeric_value = getattr(reading, f'num_{field_index}')
+            if value is None and numeric_value is None:
+                continue
+            values.setdefault(reading.id, []).append((field_index, field_name, decode_value(value, numeric_value)))
+        return values
+
+    def numeric_buckets(self, metric_id, fields, start, end, bucket_seconds, after_reading_id=0):
+        # Every field is a column, so all fields are aggregated by a single GROUP BY.
+        bucket = bucket_start(WideReading.timestamp, bucket_seconds).label('bucket')
+        columns = [bucket]
+        for mf in fields:
+            slot = numeric_slot(mf.field_index)
+            columns += [func.count(slot), func.sum(slot), func.min(slot), func.max(slot)]
+        rows = (
+            db.session.query(*columns)
+            .filter(self._in_range(metric_id, start, end, after_reading_id))
+            .group_by(bucket)
+            .all()
+        )
+        buckets = {}
+        for row in rows:
+            for position, mf in enumerate(fields):
+                count, total, low, high = row[1 + 4 * position:5 + 4 * position]
+                if count:
+                    entry = buckets[(int(row[0]), mf.id)] = empty_bucket()
+                    entry.update(count=count, sum=to_number(total), min=to_number(low), max=to_number(high))
+        if not buckets:
+            return buckets
+
+        # The newest timestamp per bucket at which each field has a value, so a newer reading
+        # without the field does not hide its last value.
+        last_ts = (
+            db.session.query(bucket, *(
+                func.max(case((numeric_slot(mf.field_index).isnot(None), WideReading.timestamp)))
+                .label(f'timestamp_{mf.field_index}')
+                for mf in fields
+            ))
+            .filter(self._in_range(metric_id, start, end, after_reading_id))
+            .group_by(bucket)
+            .subquery()
+        )
+        field_timestamps = [(mf, f'timestamp_{mf.field_index}') for mf in fields]
+        last_rows = (
+            db.session.query(last_ts, WideReading)
+            .join(WideReading, self._at_timestamps(
+                metric_id, [last_ts.c[name] for _, name in field_timestamps], after_reading_id
+            ))
+            .order_by(WideReading.id)
+            .all()
+        )
+        for row in last_rows:
+            reading = row.WideReading
+            for mf, name in field_timestamps:
+                value = getattr(reading, f'num_{mf.field_index}')
+                entry = buckets.get((int(row.bucket), mf.id))
+                if entry is not None and value is not None and reading.timestamp == getattr(row, name):
+                    entry['last'] = value
+                    entry['last_timestamp'] = reading.timestamp
+        return buckets
+
+    def numeric_values_between(self, lower_id, upper_id):
+        rows = (
+            db.session.query(WideReading, MetricField.id, MetricField.field_index)
+            .join(MetricField, and_(
+                MetricField.metric_id == WideReading.metric_id,
+                MetricField.field_type == 'numeric'
+            ))
+            .filter(WideReading.id > lower_id, WideReading.id <= upper_id)
+            .all()
+        )
+        values = []
+        for reading, field_id, field_index in rows:
+            value = getattr(reading, f'num_{field_index}')
+            if value is not None:
+                values.append((reading.metric_id, reading.timestamp, field_id, value))
+        return values
+
+    def delete_readings(self, reading_ids):
+        WideReading.query.filter(WideReading.id.in_(reading_ids)).delete(synchronize_session=False)
@@ -1,3 +1,6 @@
 __version__ = "0.1.0"
 
 from .client import AggregatorAPI
+from .exceptions import AggregatorAPIError, CircuitOpenError
+from .retry import RetryPolicy
+from .async_client import AsyncAggregatorAPI
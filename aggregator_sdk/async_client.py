@@ -0,0 +1,246 @@
+import asyncio
+import logging
+from .client import _batch_body, _history_params, _metrics_payload, _range_params
+from .config import DEFAULT_BASE_URL, DEFAULT_API_KEY
+from .exceptions import AggregatorAPIError
+from .retry import UNPROCESSED_STATUSES, CircuitBreaker, RetryPolicy, parse_retry_after
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, only needed for AsyncAggregatorAPI
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAggregatorAPI:
+    """
+    asyncio counterpart of AggregatorAPI with the same methods, as coroutines.
+
+    Requests share one aiohttp connection pool (max_connections in total) and at most
+    max_concurrency of them are in flight at once, so hundreds of calls can be gathered on a
+    single event loop without opening hundreds of connections. Retries, Retry-After and the
+    per-endpoint circuit breakers behave as in AggregatorAPI.
+
+    Requires aiohttp. Use it as an async context manager, or await close() when done:
+
+        async with AsyncAggregatorAPI() as api:
+            schema = await api.get_schema()
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, api_key=DEFAULT_API_KEY, timeout=10,
+                 retry_policy=None, failure_threshold=5, reset_timeout=30.0,
+                 max_connections=100, max_concurrency=100):
+        """
+        Initialize the async Aggregator API client.
+
+        Args:
+            base_url (str): Base URL of the aggregator server.
+            api_key (str): API key used for authorized endpoints.
+            timeout (int): Timeout in seconds for HTTP requests.
+            retry_policy (RetryPolicy): How failed requests are retried (default RetryPolicy()).
+            failure_threshold (int): Consecutive failures that open an endpoint's circuit breaker.
+            reset_timeout (float): Seconds an open circuit fails fast before a trial request.
+            max_connections (int): Size of the connection pool.
+            max_concurrency (int): Maximum number of requests in flight at once.
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncAggregatorAPI requires aiohttp (pip install aiohttp)")
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.auth_headers = {
+            "Content-Type": "application/json",
+            "X-API-Key": self.api_key
+        }
+        self.last_request_bytes = 0
+        self.metrics_cursor = 0
+        self._breakers = {}
+        # Created on first use, inside the running event loop
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Close the connection pool."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def circuit_breaker(self, endpoint):
+        """Return the circuit breaker of an endpoint (e.g. "POST /api/metrics")."""
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(endpoint, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    @staticmethod
+    def _error(status, data, headers):
+        return AggregatorAPIError(
+            f"Error {status}: {data}",
+            status_code=status,
+            retry_after=parse_retry_after(headers.get("Retry-After"))
+        )
+
+    async def _send(self, method, url, **kwargs):
+        """Send one request; returns (status, headers, parsed JSON or text)."""
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.request(method, url, **kwargs) as response:
+                text = await response.text()
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError:
+                    data = None if response.status < 400 else text
+                return response.status, response.headers, data
+
+    async def _request(self, method, path, endpoint=None, idempotent=True, **kwargs):
+        """
+        Send a request with the retry policy and the endpoint's circuit breaker.
+        See AggregatorAPI._request.
+
+        Raises:
+            CircuitOpenError: If the endpoint's circuit is open.
+            AggregatorAPIError: If the request still fails after the last attempt.
+        """
+        breaker = self.circuit_breaker(endpoint or f"{method} {path}")
+        url = f"{self.base_url}{path}"
+        policy = self.retry_policy
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before_call()
+            retry_after = None
+            try:
+                status, headers, data = await self._send(method, url, **kwargs)
+            except asyncio.TimeoutError as e:
+                breaker.record_failure()
+                retryable = idempotent
+                error = AggregatorAPIError(f"Request to {path} timed out: {e}")
+            except aiohttp.ClientConnectorError as e:
+                # Failed to connect: the request was never sent.
+                breaker.record_failure()
+                retryable = True
+                error = AggregatorAPIError(f"Request to {path} failed: {e}")
+            except aiohttp.ClientConnectionError as e:
+                breaker.record_failure()
+                retryable = idempotent
+                error = AggregatorAPIError(f"Request to {path} failed: {e}")
+            except BaseException:
+                # Anything else (e.g. a truncated payload) still ends a half-open trial.
+                breaker.record_failure()
+                raise
+            else:
+                if status not in policy.retry_statuses:
+                    if status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    if status >= 400:
+                        raise self._error(status, data, headers)
+                    if data is None:
+                        raise AggregatorAPIError("Failed to parse JSON")
+                    return data
+                breaker.record_failure()
+                retryable = idempotent or status in UNPROCESSED_STATUSES
+                retry_after = parse_retry_after(headers.get("Retry-After"))
+                error = self._error(status, data, headers)
+            if not retryable or attempt >= policy.max_attempts:
+                raise error
+            delay = policy.delay(attempt, retry_after)
+            logger.debug("Retrying %s %s in %.2fs (attempt %d of %d)", method, path, delay, attempt + 1,
+                         policy.max_attempts)
+            await asyncio.sleep(delay)
+
+    async def get_metrics(self, since=None):
+        """Retrieve the latest metrics snapshot. See AggregatorAPI.get_metrics."""
+        params = {"since": since} if since is not None else None
+        return await self._request("GET", "/api/metrics", params=params)
+
+    async def get_metric_changes(self):
+        """Return the metrics whose latest reading changed since the previous call. See AggregatorAPI.get_metric_changes."""
+        data = await self.get_metrics(since=self.metrics_cursor)
+        self.metrics_cursor = data.get("cursor", self.metrics_cursor)
+        return data.get("metrics", [])
+
+    async def get_history(self, metric_id, page=1, page_size=20, before=None, include_total=True):
+        """Retrieve historical readings for a given metric. See AggregatorAPI.get_history."""
+        params = _history_params(page, page_size, before, include_total)
+        return await self._request("GET", f"/api/history/{metric_id}", endpoint="GET /api/history", params=params)
+
+    async def iter_history(self, metric_id, page_size=100):
+        """Asynchronously iterate over the full history of a metric, newest first."""
+        before = None
+        while True:
+            data = await self.get_history(metric_id, page_size=page_size, before=before, include_total=False)
+            for record in data.get("history", []):
+                yield record
+            before = data.get("next_cursor")
+            if not before:
+                return
+
+    async def get_range(self, metric_id, start=None, end=None, bucket="1m", agg=("avg",)):
+        """Retrieve the numeric fields of a metric aggregated into time buckets. See AggregatorAPI.get_range."""
+        params = _range_params(start, end, bucket, agg)
+        return await self._request("GET", f"/api/history/{metric_id}/range", endpoint="GET /api/history/range",
+                                   params=params)
+
+    async def send_command(self, device, command):
+        """Send a command to a device."""
+        payload = {"device": device, "command": command}
+        return await self._request("POST", "/api/command", idempotent=False, json=payload)
+
+    async def broadcast_command(self, device_type, command):
+        """Send a command to every device of a type. See AggregatorAPI.broadcast_command."""
+        payload = {"device_type": device_type, "command": command}
+        return await self._request("POST", "/api/command", idempotent=False, json=payload)
+
+    async def get_commands(self, friendly_name, wait=None):
+        """Retrieve pending commands for a given device, long polling up to `wait` seconds. See AggregatorAPI.get_commands."""
+        if not wait:
+            return await self._request("GET", f"/api/command/{friendly_name}", endpoint="GET /api/command",
+                                       idempotent=False)
+        return await self._request("GET", f"/api/command/{friendly_name}", endpoint="GET /api/command",
+                                   idempotent=False, params={"wait": wait},
+                                   timeout=aiohttp.ClientTimeout(total=self.timeout + wait))
+
+    async def register_device(self, role, friendly_name):
+        """Register a new device with the aggregator."""
+        payload = {"role": role, "friendly_name": friendly_name}
+        return await self._request("POST", "/api/register", idempotent=False, json=payload)
+
+    async def post_metrics(self, device_guid, metrics, timestamp=None, idempotency_key=None):
+        """Post metrics for a device. See AggregatorAPI.post_metrics."""
+        payload = _metrics_payload(device_guid, metrics, timestamp, idempotency_key)
+        return await self._request("POST", "/api/metrics", idempotent=idempotency_key is not None,
+                                   json=payload, headers=self.auth_headers)
+
+    async def post_metrics_batch(self, envelopes, compress=False):
+        """Post metrics for many devices and time points in a single request. See AggregatorAPI.post_metrics_batch."""
+        body, headers, idempotent = _batch_body(envelopes, compress)
+        self.last_request_bytes = len(body)
+        return await self._request("POST", "/api/metrics/batch", idempotent=idempotent, data=body,
+                                   headers={**self.auth_headers, **headers})
+
+    async def get_schema(self):
+        """Retrieve the current schema of devices and metrics."""
+        return await self._request("GET", "/api/schema")
@@ -1,25 +1,139 @@
+import gzip
+import json
+import logging
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from .config import DEFAULT_BASE_URL, DEFAULT_API_KEY
 from .exceptions import AggregatorAPIError
+from .retry import UNPROCESSED_STATUSES, CircuitBreaker, RetryPolicy, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+def _not_sent(error):
+    """Whether a requests ConnectionError / Timeout was raised before the request was sent."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+# Request builders shared with AsyncAggregatorAPI
+
+def _as_param(value):
+    """Send datetimes as ISO 8601 and anything else (strings, epoch seconds) unchanged."""
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _history_params(page, page_size, before, include_total):
+    params = {"page": page, "page_size": page_size}
+    if before is not None:
+        params["before"] = before
+    if not include_total:
+        params["include_total"] = "false"
+    return params
+
+
+def _range_params(start, end, bucket, agg):
+    params = {"bucket": bucket, "agg": agg if isinstance(agg, str) else ",".join(agg)}
+    for name, value in (("start", start), ("end", end)):
+        if value is not None:
+            params[name] = _as_param(value)
+    return params
+
+
+def _metrics_payload(device_guid, metrics, timestamp, idempotency_key):
+    payload = {"device_guid": device_guid, "metrics": metrics}
+    if timestamp is not None:
+        payload["timestamp"] = _as_param(timestamp)
+    if idempotency_key is not None:
+        payload["idempotency_key"] = idempotency_key
+    return payload
+
+
+def _batch_body(envelopes, compress):
+    """
+    Encode batch envelopes as a JSON (optionally gzipped) body.
+    Returns the body, the extra headers and whether every envelope is idempotent.
+    """
+    payload = []
+    for envelope in envelopes:
+        envelope = dict(envelope)
+        if envelope.get("timestamp") is not None:
+            envelope["timestamp"] = _as_param(envelope["timestamp"])
+        payload.append(envelope)
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    headers = {}
+    if compress:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers, all(envelope.get("idempotency_key") for envelope in payload)
+
 
 class AggregatorAPI:
-    def __init__(self, base_url=DEFAULT_BASE_URL, api_key=DEFAULT_API_KEY, timeout=10):
+    def __init__(self, base_url=DEFAULT_BASE_URL, api_key=DEFAULT_API_KEY, timeout=10,
+                 retry_policy=None, failure_threshold=5, reset_timeout=30.0,
+                 pool_connections=4, pool_maxsize=10, session=None):
         """
         Initialize the Aggregator API client.
 
+        The client owns a requests.Session, so connections are kept alive and reused across
+        calls instead of paying a TCP and TLS handshake per request. One client can be shared
+        by several threads; pool_maxsize bounds the connections kept open per host and should
+        be at least the number of threads using the client concurrently. Call close() (or
+        use the client as a context manager) to release the connections.
+
         Args:
             base_url (str): Base URL of the aggregator server.
             api_key (str): API key used for authorized endpoints.
             timeout (int): Timeout in seconds for HTTP requests.
+            retry_policy (RetryPolicy): How failed requests are retried (default RetryPolicy()).
+            failure_threshold (int): Consecutive failures that open an endpoint's circuit breaker.
+            reset_timeout (float): Seconds an open circuit fails fast before a trial request.
+            pool_connections (int): Number of per-host connection pools to cache.
+            pool_maxsize (int): Maximum connections kept alive per host.
+            session (requests.Session): Session to use instead of creating one; it is not
+                                        closed by close().
         """
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # endpoint name (e.g. "GET /api/history") -> CircuitBreaker
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._owns_session = session is None
+        self.session = session or requests.Session()
+        if self._owns_session:
+            # Retries are handled by _request, not by urllib3.
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
         # Headers for endpoints that require authentication (e.g. posting metrics)
         self.auth_headers = {
             "Content-Type": "application/json",
             "X-API-Key": self.api_key
         }
+        # Size in bytes of the last request body sent by post_metrics_batch
+        self.last_request_bytes = 0
+        # Cursor of the last get_metric_changes response (0: nothing seen yet)
+        self.metrics_cursor = 0
+
+    def close(self):
+        """Close the pooled connections of the client's own session."""
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def _handle_response(self, response):
         """
@@ -33,31 +147,157 @@ class AggregatorAPI:
                 error_data = response.json()
             except Exception:
                 error_data = response.text
-            raise AggregatorAPIError(f"Error {response.status_code}: {error_data}")
+            raise AggregatorAPIError(
+                f"Error {response.status_code}: {error_data}",
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After"))
+            )
         try:
             return response.json()
         except Exception as e:
             raise AggregatorAPIError(f"Failed to parse JSON: {e}")
 
-    def get_metrics(self):
-        """Retrieve the latest metrics snapshot."""
-        url = f"{self.base_url}/api/metrics"
-        response = requests.get(url, timeout=self.timeout)
-        return self._handle_response(response)
+    def circuit_breaker(self, endpoint):
+        """Return the circuit breaker of an endpoint (e.g. "POST /api/metrics")."""
+        with self._breakers_lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(
+                    endpoint, self.failure_threshold, self.reset_timeout
+                )
+            return breaker
+
+    def _request(self, method, path, endpoint=None, idempotent=True, **kwargs):
+        """
+        Send a request with the retry policy and the endpoint's circuit breaker.
+
+        Connection failures, timeouts and retryable statuses (429, 502, 503, 504 by default)
+        are retried with backoff, honoring Retry-After. Non-idempotent calls are only retried
+        when the server cannot have applied them: failures to connect, 429 and 503. Other
+        error statuses are returned to _handle_response at once.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Request path, appended to base_url.
+            endpoint (str): Circuit breaker name; defaults to "<method> <path>". Pass it for
+                            paths containing ids so they share one breaker.
+            idempotent (bool): Whether the call is safe to repeat if it may have been applied.
 
-    def get_history(self, metric_id, page=1, page_size=20):
+        Raises:
+            CircuitOpenError: If the endpoint's circuit is open.
+            AggregatorAPIError: If the request still fails after the last attempt.
+        """
+        breaker = self.circuit_breaker(endpoint or f"{method} {path}")
+        url = f"{self.base_url}{path}"
+        policy = self.retry_policy
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before_call()
+            retry_after = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.record_failure()
+                # A connection reset or read timeout may come after the server applied the request.
+                retryable = idempotent or _not_sent(e)
+                error = AggregatorAPIError(f"Request to {path} failed: {e}")
+            except BaseException:
+                # Anything else (e.g. a broken chunked response) still ends a half-open trial.
+                breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in policy.retry_statuses:
+                    # The server answered; client errors do not count against the circuit.
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return self._handle_response(response)
+                breaker.record_failure()
+                retryable = idempotent or response.status_code in UNPROCESSED_STATUSES
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                error = None
+            if not retryable or attempt >= policy.max_attempts:
+                if error is None:
+                    return self._handle_response(response)
+                raise error
+            delay = policy.delay(attempt, retry_after)
+            logger.debug("Retrying %s %s in %.2fs (attempt %d of %d)", method, path, delay, attempt + 1,
+                         policy.max_attempts)
+            time.sleep(delay)
+
+    def get_metrics(self, since=None):
+        """
+        Retrieve the latest metrics snapshot.
+
+        Args:
+            since (int): Cursor from a previous response. When given, only metrics whose latest
+                         reading changed are returned, as {"metrics": [...], "cursor": ...}.
+        """
+        params = {"since": since} if since is not None else None
+        return self._request("GET", "/api/metrics", params=params)
+
+    def get_metric_changes(self):
+        """
+        Return the metrics whose latest reading changed since the previous call (all of them
+        on the first call). The cursor is kept in `metrics_cursor`, so a polling loop only
+        transfers what changed; set it back to 0 to start over. Concurrent callers sharing a
+        client share the cursor and split the changes between them. The server's cursor trails
+        the newest readings a little, so a metric can be returned by consecutive calls; keep
+        the reading with the newest timestamp per metric_id.
+        """
+        data = self.get_metrics(since=self.metrics_cursor)
+        self.metrics_cursor = data.get("cursor", self.metrics_cursor)
+        return data.get("metrics", [])
+
+    def get_history(self, metric_id, page=1, page_size=20, before=None, include_total=True):
         """
         Retrieve historical readings for a given metric.
         
         Args:
             metric_id (int): The ID of the metric.
-            page (int): Page number for pagination.
+            page (int): Page number for pagination (ignored when `before` is given).
             page_size (int): Number of items per page.
+            before (str): Cursor from a previous response's "next_cursor" for keyset paging.
+            include_total (bool): Whether the server should count the total number of readings.
+        """
+        params = _history_params(page, page_size, before, include_total)
+        return self._request("GET", f"/api/history/{metric_id}", endpoint="GET /api/history", params=params)
+
+    def iter_history(self, metric_id, page_size=100):
+        """
+        Iterate over the full history of a metric, newest first.
+        Pages are fetched lazily by cursor, so each request costs the same however deep it is.
+
+        Args:
+            metric_id (int): The ID of the metric.
+            page_size (int): Number of readings fetched per request.
+        """
+        before = None
+        while True:
+            data = self.get_history(metric_id, page_size=page_size, before=before, include_total=False)
+            for record in data.get("history", []):
+                yield record
+            before = data.get("next_cursor")
+            if not before:
+                return
+
+    def get_range(self, metric_id, start=None, end=None, bucket="1m", agg=("avg",)):
+        """
+        Retrieve the numeric fields of a metric aggregated into time buckets.
+
+        Args:
+            metric_id (int): The ID of the metric.
+            start (datetime|str|float): Start of the range (defaults to one day before end).
+            end (datetime|str|float): End of the range (defaults to now).
+            bucket (str): Bucket size, e.g. "30s", "1m", "1h" or "1d".
+            agg (list|str): Aggregates to compute: avg, min, max, count and/or last.
         """
-        url = f"{self.base_url}/api/history/{metric_id}"
-        params = {"page": page, "page_size": page_size}
-        response = requests.get(url, params=params, timeout=self.timeout)
-        return self._handle_response(response)
+        params = _range_params(start, end, bucket, agg)
+        return self._request("GET", f"/api/history/{metric_id}/range", endpoint="GET /api/history/range",
+                             params=params)
 
     def send_command(self, device, command):
         """
@@ -67,23 +307,40 @@ class AggregatorAPI:
             device (str): Friendly name of the device.
             command (str): Command to be executed.
         """
-        url = f"{self.base_url}/api/command"
         payload = {"device": device, "command": command}
-        response = requests.post(url, json=payload, 
-                                 headers={"Content-Type": "application/json"}, 
-                                 timeout=self.timeout)
-        return self._handle_response(response)
+        return self._request("POST", "/api/command", idempotent=False, json=payload,
+                             headers={"Content-Type": "application/json"})
+
+    def broadcast_command(self, device_type, command):
+        """
+        Send a command to every device of a type. Devices that already have a pending
+        command, or executed one in the last 3 minutes, are skipped.
 
-    def get_commands(self, friendly_name):
+        Args:
+            device_type (str): Device type (the role it registered with).
+            command (str): Command to be executed.
+
+        Returns:
+            dict: {"status": ..., "devices": <number of devices the command was queued for>}
+        """
+        payload = {"device_type": device_type, "command": command}
+        return self._request("POST", "/api/command", idempotent=False, json=payload,
+                             headers={"Content-Type": "application/json"})
+
+    def get_commands(self, friendly_name, wait=None):
         """
         Retrieve pending commands for a given device.
 
         Args:
             friendly_name (str): Friendly name of the device.
+            wait (float): Seconds the server may hold the request until a command arrives
+                          (long polling). The read timeout is extended by the same amount.
         """
-        url = f"{self.base_url}/api/command/{friendly_name}"
-        response = requests.get(url, timeout=self.timeout)
-        return self._handle_response(response)
+        if not wait:
+            return self._request("GET", f"/api/command/{friendly_name}", endpoint="GET /api/command",
+                                 idempotent=False)
+        return self._request("GET", f"/api/command/{friendly_name}", endpoint="GET /api/command",
+                             idempotent=False, params={"wait": wait}, timeout=self.timeout + wait)
 
     def register_device(self, role, friendly_name):
         """
@@ -93,14 +350,11 @@ class AggregatorAPI:
             role (str): Role of the device (e.g. "PC-Metrics", "OpenSky-Collector").
             friendly_name (str): A human-friendly device name.
         """
-        url = f"{self.base_url}/api/register"
         payload = {"role": role, "friendly_name": friendly_name}
-        response = requests.post(url, json=payload, 
-                                 headers={"Content-Type": "application/json"}, 
-                                 timeout=self.timeout)
-        return self._handle_response(response)
+        return self._request("POST", "/api/register", idempotent=False, json=payload,
+                             headers={"Content-Type": "application/json"})
 
-    def post_metrics(self, device_guid, metrics):
+    def post_metrics(self, device_guid, metrics, timestamp=None, idempotency_key=None):
         """
         Post metrics for a device.
 
@@ -108,14 +362,35 @@ class AggregatorAPI:
             device_guid (str): The GUID of the registered device.
             metrics (list): A list of metrics dictionaries. Each metric should include a "name"
                             and a "fields" dictionary.
+            timestamp (datetime|str|float): When the metrics were collected (UTC); defaults to
+                                            the time the server stores them.
+            idempotency_key (str): Unique key of this payload, so a retried or replayed post
+                                   is only stored once.
+        """
+        payload = _metrics_payload(device_guid, metrics, timestamp, idempotency_key)
+        # Without an idempotency key a timed-out post may already have been stored.
+        return self._request("POST", "/api/metrics", idempotent=idempotency_key is not None,
+                             json=payload, headers=self.auth_headers)
+
+    def post_metrics_batch(self, envelopes, compress=False):
+        """
+        Post metrics for many devices and time points in a single request.
+
+        Args:
+            envelopes (list): A list of envelope dictionaries, each with a "device_guid", a
+                              "metrics" list (as for post_metrics) and optionally a "timestamp"
+                              (datetime, ISO 8601 string or epoch seconds) and an
+                              "idempotency_key".
+            compress (bool): Whether to gzip the request body.
+
+        Returns:
+            dict: The server response, whose "results" list holds a status per envelope.
         """
-        url = f"{self.base_url}/api/metrics"
-        payload = {"device_guid": device_guid, "metrics": metrics}
-        response = requests.post(url, json=payload, headers=self.auth_headers, timeout=self.timeout)
-        return self._handle_response(response)
+        body, headers, idempotent = _batch_body(envelopes, compress)
+        self.last_request_bytes = len(body)
+        return self._request("POST", "/api/metrics/batch", idempotent=idempotent, data=body,
+                             headers={**self.auth_headers, **headers})
 
     def get_schema(self):
         """Retrieve the current schema of devices and metrics."""
-        url = f"{self.base_url}/api/schema"
-        response = requests.get(url, timeout=self.timeout)
-        return self._handle_response(response)
+        return self._request("GET", "/api/schema")
@@ -1,3 +1,14 @@
 class AggregatorAPIError(Exception):
     """Custom exception for errors returned from the Aggregator API."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        # HTTP status of the failed response (None for connection errors)
+        self.status_code = status_code
+        # Seconds the server or circuit breaker asked the caller to wait, if any
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(AggregatorAPIError):
+    """Raised without contacting the server while an endpoint's circuit breaker is open."""
     pass
@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from .exceptions import CircuitOpenError
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delta seconds or an HTTP date) into seconds.
+    Returns None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+# Retryable statuses that mean the server did not act on the request, so non-idempotent
+# calls may be repeated too; after a 502 or 504 the request may already have been applied.
+UNPROCESSED_STATUSES = frozenset((429, 503))
+
+
+class RetryPolicy:
+    """
+    How AggregatorAPI retries a failed request.
+
+    Delays grow exponentially from base_delay by `multiplier` per attempt, capped at
+    max_delay, with "full jitter" (a random delay between 0 and that bound) so a fleet of
+    agents reconnecting after an outage spreads its retries out. A Retry-After header sent
+    by the server takes precedence, up to max_retry_after.
+
+    Args:
+        max_attempts (int): Total attempts per call, including the first (1 disables retries).
+        base_delay (float): Upper bound of the first retry delay in seconds.
+        max_delay (float): Upper bound of any computed delay in seconds.
+        multiplier (float): Growth factor of the delay bound per attempt.
+        max_retry_after (float): Longest Retry-After the client is willing to wait.
+        retry_statuses (iterable): HTTP status codes that are retried.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0, multiplier=2.0,
+                 max_retry_after=120.0, retry_statuses=(429, 502, 503, 504)):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number `attempt` (1-based)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        bound = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return random.uniform(0, bound)
+
+    @classmethod
+    def none(cls):
+        """A policy that never retries."""
+        return cls(max_attempts=1)
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    After failure_threshold consecutive failures the circuit opens and calls fail fast with
+    CircuitOpenError for reset_timeout seconds. The first call after that is let through as
+    a trial: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial call running.
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return
+            retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"Circuit open for {self.name}", retry_after=retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
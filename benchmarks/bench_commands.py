@@ -0,0 +1,92 @@
+"""
+Command fan-out and claiming at thousands of devices.
+
+Queues one command for every device of a type with a single broadcast_command, and with a
+send_device_command per device, then has every device claim its commands with
+get_pending_commands, sequentially and from --threads concurrent workers that all poll
+every device. The concurrent run checks that each command is delivered exactly once.
+
+    python benchmarks/bench_commands.py [--devices 3000] [--threads 4]
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import add_devices, bench_app, count_queries, measure, print_table, summarize
+from aggregator.services.command_service import broadcast_command, get_pending_commands, send_device_command
+
+
+def _names(devices):
+    return [f'bench-{i}' for i in range(devices)]
+
+
+def _claim_concurrently(app, names, threads):
+    """Every worker claims every device's commands in its own order. Returns the delivered ids."""
+    delivered = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        order = names[:]
+        random.Random(seed).shuffle(order)
+        with app.app_context():
+            for name in order:
+                commands, _ = get_pending_commands(name)
+                with lock:
+                    delivered.extend(command['id'] for command in commands)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return delivered
+
+
+def run(devices, threads, repeat):
+    names = _names(devices)
+    rows = []
+
+    with bench_app():
+        add_devices(devices)
+        with count_queries() as queries:
+            start = time.perf_counter()
+            queued, _ = broadcast_command('PC', 'restart')
+            elapsed = time.perf_counter() - start
+        rows.append(('broadcast_command', queued, queries[0], elapsed * 1000, '-', '-'))
+
+        claims = iter(names)
+        with count_queries() as queries:
+            get_pending_commands(next(claims))
+        claim = summarize(measure(lambda: get_pending_commands(next(claims)), min(repeat, devices - 1), warmup=0))
+        rows.append(('get_pending_commands', 1, queries[0], '-', *claim))
+
+    with bench_app():
+        add_devices(devices)
+        sends = iter(names)
+        with count_queries() as queries:
+            start = time.perf_counter()
+            durations = measure(lambda: send_device_command(next(sends), 'restart'), devices, warmup=0)
+            elapsed = time.perf_counter() - start
+        rows.append(('send_device_command x N', devices, queries[0], elapsed * 1000, *summarize(durations)))
+
+    with bench_app() as app:
+        add_devices(devices)
+        queued, _ = broadcast_command('PC', 'restart')
+        start = time.perf_counter()
+        delivered = _claim_concurrently(app, names, threads)
+        elapsed = time.perf_counter() - start
+        rows.append((f'claim, {threads} workers', len(delivered), '-', elapsed * 1000, '-', '-'))
+
+    print_table(['operation', 'commands', 'queries', 'total ms', 'median ms', 'p95 ms'], rows)
+    duplicates = len(delivered) - len(set(delivered))
+    print(f'\nConcurrent claim: {queued} queued, {len(set(delivered))} delivered, {duplicates} delivered twice')
+    if duplicates or len(delivered) != queued:
+        raise SystemExit('Commands were lost or delivered more than once')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--devices', type=int, default=3000)
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent claiming workers')
+    parser.add_argument('--repeat', type=int, default=500, help='Devices timed in the sequential claim')
+    args = parser.parse_args()
+    run(args.devices, args.threads, args.repeat)
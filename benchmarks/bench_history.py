@@ -0,0 +1,57 @@
+"""
+History pages (GET /api/history/<metric_id>): queries per page and latency.
+
+One metric with five numeric fields is seeded with --readings readings, then pages of
+--page-size readings are fetched at several depths, in offset and keyset mode. A page must
+cost two queries (readings, then their values) plus the optional COUNT(*), whatever its
+size or depth.
+
+    python benchmarks/bench_history.py [--readings 20000] [--page-size 100] [--storage eav|wide]
+"""
+import argparse
+
+from common import add_devices, bench_app, count_queries, measure, print_table, seed_readings, summarize
+from aggregator.config import Config
+from aggregator.models import Metric
+from aggregator.services.history_service import get_metric_history
+
+
+def _cursor_for_page(metric_id, page, page_size):
+    """The keyset cursor that starts the given (1-based) page."""
+    cursor = None
+    for _ in range(page - 1):
+        cursor = get_metric_history(metric_id, page_size=page_size, before=cursor, include_total=False)['next_cursor']
+    return cursor
+
+
+def run(readings, page_size, repeat):
+    pages = [1, 10, max(1, readings // page_size)]
+    rows = []
+    with bench_app():
+        seed_readings(add_devices(1), 1, readings, fields=5)
+        metric_id = Metric.query.one().id
+        for page in pages:
+            cursor = _cursor_for_page(metric_id, page, page_size)
+            modes = [
+                ('offset', lambda: get_metric_history(metric_id, page=page, page_size=page_size)),
+                ('offset, no total', lambda: get_metric_history(
+                    metric_id, page=page, page_size=page_size, include_total=False)),
+                ('keyset', lambda: get_metric_history(
+                    metric_id, page_size=page_size, before=cursor, include_total=False)),
+            ]
+            for mode, fetch in modes:
+                with count_queries() as queries:
+                    fetch()
+                rows.append((page, mode, queries[0], *summarize(measure(fetch, repeat))))
+    print_table(['page', 'mode', 'queries', 'median ms', 'p95 ms'], rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readings', type=int, default=20000, help='Readings stored for the metric')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50, help='Timed fetches per page and mode')
+    parser.add_argument('--storage', choices=['eav', 'wide'], default=Config.READING_STORAGE)
+    args = parser.parse_args()
+    Config.READING_STORAGE = args.storage
+    run(args.readings, args.page_size, args.repeat)
@@ -0,0 +1,46 @@
+"""
+Latest-metrics snapshot (GET /api/metrics) as the number of metrics grows.
+
+For each size, devices with 10 metrics each are seeded with a few readings per metric, then
+get_latest_metrics (the snapshot loader) and the GET /api/metrics endpoint are timed. The
+loader's query count must stay constant; its latency should only grow with the rows it
+returns, not with the history behind them.
+
+    python benchmarks/bench_latest_snapshot.py [--sizes 10,100,1000,10000] [--repeat 20]
+"""
+import argparse
+
+from common import add_devices, bench_app, count_queries, measure, print_table, seed_readings, summarize
+from aggregator.services.metrics_query_service import get_latest_metrics
+from aggregator.services.snapshot_service import latest_snapshot
+
+METRICS_PER_DEVICE = 10
+
+
+def run(sizes, repeat, rounds):
+    rows = []
+    for size in sizes:
+        with bench_app() as app:
+            guids = add_devices(max(1, size // METRICS_PER_DEVICE))
+            seed_readings(guids, min(size, METRICS_PER_DEVICE), rounds)
+            with count_queries() as queries:
+                get_latest_metrics()
+            loader = summarize(measure(get_latest_metrics, repeat))
+
+            client = app.test_client()
+            # Every request recomputes the snapshot, as the first poll after the TTL does
+            def request():
+                latest_snapshot.invalidate()
+                client.get('/api/metrics')
+            endpoint = summarize(measure(request, repeat))
+        rows.append((size, queries[0], *loader, *endpoint))
+    print_table(['metrics', 'queries', 'loader ms', 'loader p95', 'GET ms', 'GET p95'], rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='Comma-separated metric counts')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed calls per size')
+    parser.add_argument('--rounds', type=int, default=5, help='Readings stored per metric')
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(',')], args.repeat, args.rounds)
@@ -0,0 +1,75 @@
+"""
+SDK requests over a pooled keep-alive session versus a fresh connection per request.
+
+A local stub server answers GET /api/schema. The same number of calls is made with
+requests.get (a new connection every time, as the SDK used to do) and with one shared
+AggregatorAPI, sequentially and from --threads threads like the collector's. Locally only
+the TCP handshake is saved; against the hosted server each fresh connection also pays
+the TLS handshake and the network round trips, so the gap is wider there.
+
+    python benchmarks/bench_sdk_session.py [--requests 500] [--threads 4]
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from common import measure, print_table, summarize
+from aggregator_sdk.client import AggregatorAPI
+
+BODY = json.dumps([{'device': 'pc1', 'metrics': []}]).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer the response so headers and body go out in one segment (no Nagle delay)
+    wbufsize = 65536
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _threaded(call, count, threads):
+    """Seconds per call when `count` calls are spread over `threads` threads."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: call(), range(count)))
+    return (time.perf_counter() - start) / count
+
+
+def run(count, threads):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        def fresh():
+            requests.get(base_url + '/api/schema', timeout=10).json()
+
+        with AggregatorAPI(base_url, pool_maxsize=threads) as api:
+            rows = []
+            for label, call in (('fresh connection', fresh), ('pooled session', api.get_schema)):
+                sequential = summarize(measure(call, count, warmup=5))
+                rows.append((label, *sequential, _threaded(call, count, threads) * 1000))
+    finally:
+        server.shutdown()
+        server.server_close()
+    print_table(['client', 'median ms', 'p95 ms', f'ms/call, {threads} threads'], rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500, help='Calls per client and mode')
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+    run(args.requests, args.threads)
@@ -0,0 +1,53 @@
+"""
+EAV (reading + reading_value) versus wide (reading_wide) reading storage on the same dataset.
+
+For each layout the same samples (--devices devices x --metrics metrics with five numeric
+fields, --rounds times) are ingested in write-behind sized batches, then history pages and
+a one-hour range query are timed on one metric.
+
+    python benchmarks/bench_storage.py [--devices 50] [--metrics 10] [--rounds 40]
+"""
+import argparse
+import time
+
+from common import add_devices, bench_app, measure, print_table, seed_readings, summarize
+from aggregator.config import Config
+from aggregator.models import db, Metric, ReadingValue
+from aggregator.services.history_service import get_metric_history
+from aggregator.services.range_service import get_metric_range
+from aggregator.storage import get_storage
+
+
+def run(devices, metrics, rounds, repeat):
+    rows = []
+    for engine in ('eav', 'wide'):
+        Config.READING_STORAGE = engine
+        with bench_app():
+            guids = add_devices(devices)
+            start = time.perf_counter()
+            samples = seed_readings(guids, metrics, rounds, fields=5)
+            elapsed = time.perf_counter() - start
+
+            storage = get_storage()
+            table_rows = db.session.query(storage.model).count()
+            if engine == 'eav':
+                table_rows += db.session.query(ReadingValue).count()
+
+            metric_id = Metric.query.order_by(Metric.id).first().id
+            history = summarize(measure(lambda: get_metric_history(metric_id, page_size=100), repeat))
+            value_range = summarize(measure(lambda: get_metric_range(metric_id, aggregates=('avg', 'max')), repeat))
+        rows.append((engine, samples, table_rows, samples / elapsed, *history, *value_range))
+    print_table(
+        ['layout', 'samples', 'rows', 'samples/s', 'history ms', 'history p95', 'range ms', 'range p95'],
+        rows
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--metrics', type=int, default=10, help='Metrics per device')
+    parser.add_argument('--rounds', type=int, default=40, help='Readings per metric')
+    parser.add_argument('--repeat', type=int, default=50, help='Timed history and range queries per layout')
+    args = parser.parse_args()
+    run(args.devices, args.metrics, args.rounds, args.repeat)
@@ -0,0 +1,117 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Each benchmark runs the aggregator's services on a throwaway SQLite database, so a run
+before and after a change on the same machine gives comparable numbers. Absolute timings
+on the hosted MySQL database will differ; the trends and query counts are what to compare.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+from aggregator.config import Config  # noqa: E402
+from aggregator.models import db, Device  # noqa: E402
+from aggregator.api.routes import api_bp  # noqa: E402
+from aggregator.services.definition_cache import get_device_ref  # noqa: E402
+from aggregator.services.metrics_service import Envelope, ingest_envelopes  # noqa: E402
+
+# Envelopes per ingest_envelopes call when seeding, like the write-behind writer's batches
+SEED_BATCH_SIZE = 200
+
+
+@contextmanager
+def bench_app():
+    """An app context on a fresh, empty SQLite database that is removed afterwards."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config.from_object(Config)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        app.register_blueprint(api_bp)
+        with app.app_context():
+            db.create_all()
+            try:
+                yield app
+            finally:
+                db.session.remove()
+                db.engine.dispose()
+
+
+def add_devices(count, device_type='PC'):
+    """Register `count` devices in one insert. Returns their guids."""
+    guids = [str(uuid.uuid4()) for _ in range(count)]
+    db.session.execute(insert(Device), [
+        {'guid': guid, 'friendly_name': f'bench-{i}', 'type': device_type} for i, guid in enumerate(guids)
+    ])
+    db.session.commit()
+    return guids
+
+
+def seed_readings(guids, metrics_per_device, rounds, fields=1):
+    """
+    Ingest `rounds` readings of `metrics_per_device` numeric metrics (with `fields` fields
+    each) for every device, through ingest_envelopes. Returns the number of samples written.
+    """
+    devices = [get_device_ref(guid) for guid in guids]
+    envelopes = []
+    for round_number in range(rounds):
+        for device in devices:
+            envelopes.append(Envelope(device, [
+                {'name': f'metric-{m}', 'fields': {f'f{f}': round_number + f for f in range(fields)}}
+                for m in range(metrics_per_device)
+            ]))
+    for start in range(0, len(envelopes), SEED_BATCH_SIZE):
+        ingest_envelopes(envelopes[start:start + SEED_BATCH_SIZE])
+    return len(envelopes) * metrics_per_device
+
+
+@contextmanager
+def count_queries():
+    """Count the statements sent to the database inside the block (read `counter[0]`)."""
+    counter = [0]
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def measure(func, repeat, warmup=1):
+    """Call func `warmup` times untimed, then `repeat` times. Returns the durations in seconds."""
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(durations):
+    """Median and 95th percentile of durations, in milliseconds."""
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return statistics.median(ordered) * 1000, p95 * 1000
+
+
+def print_table(headers, rows):
+    """Print rows as aligned columns; floats are shown with two decimals."""
+    cells = [[f'{value:.2f}' if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(str(h)), *(len(row[i]) for row in cells)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in cells:
+        print('  '.join(value.rjust(w) for value, w in zip(row, widths)))
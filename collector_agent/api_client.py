@@ -0,0 +1,16 @@
+import threading
+from aggregator_sdk.client import AggregatorAPI
+
+_client = None
+_lock = threading.Lock()
+
+def get_aggregator():
+    """
+    Returns the AggregatorAPI client shared by every collector thread, so they all reuse
+    the same pool of keep-alive connections to the aggregator.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = AggregatorAPI()
+        return _client
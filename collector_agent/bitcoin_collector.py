@@ -1,7 +1,7 @@
 import logging
 import requests
-import time
 from registration import register_device
+from metrics_queue import build_payload
 from collector_agent.config import BITCOIN_DEVICE_FRIENDLY_NAME, BITCOIN_DEVICE_ROLE, BITCOIN_GUID_FILE
 
 def collect_bitcoin_metrics():
@@ -39,26 +39,12 @@ def collect_bitcoin_metrics():
     if not device_guid:
         device_guid = "unregistered"
 
-    payload = {
-        "device_guid": device_guid,
-        "metrics": [
-            {"name": "Bitcoin Metrics", "fields": {
-                "price": price,
-                "market_cap": market_cap,
-                "price_change_24h": price_change_24h
-            }}
-        ]
-    }
+    payload = build_payload(device_guid, [
+        {"name": "Bitcoin Metrics", "fields": {
+            "price": price,
+            "market_cap": market_cap,
+            "price_change_24h": price_change_24h
+        }}
+    ])
     logging.info("Bitcoin collector payload: %s", payload)
     return payload
-
-def run_bitcoin_collector(metrics_queue, interval=10):
-    """
-    Runs the Bitcoin collector agent which periodically fetches metrics
-    from CoinGecko and puts them on the metrics_queue only if they are valid.
-    """
-    while True:
-        payload = collect_bitcoin_metrics()
-        if payload is not None:
-            metrics_queue.put(payload)
-        time.sleep(interval)
@@ -18,4 +18,37 @@ BITCOIN_GUID_FILE = os.environ.get("BITCOIN_GUID_FILE", "bitcoin_guid.txt")
 # Ethereum Dominance metrics device configuration
 ETH_DOMINANCE_DEVICE_FRIENDLY_NAME = os.environ.get("ETH_DOMINANCE_FRIENDLY_NAME", "ETH-Dominance")
 ETH_DOMINANCE_DEVICE_ROLE = os.environ.get("ETH_DOMINANCE_ROLE", "ETH-Dominance-Collector")
-ETH_DOMINANCE_GUID_FILE = os.environ.get("ETH_DOMINANCE_GUID_FILE", "eth_dominance_guid.txt")
\ No newline at end of file
+ETH_DOMINANCE_GUID_FILE = os.environ.get("ETH_DOMINANCE_GUID_FILE", "eth_dominance_guid.txt")
+# Uploader batching: send up to UPLOAD_BATCH_SIZE payloads per request, waiting at most
+# UPLOAD_MAX_WAIT_MS for a batch to fill
+UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 100))
+UPLOAD_MAX_WAIT_MS = int(os.environ.get("UPLOAD_MAX_WAIT_MS", 1000))
+UPLOAD_COMPRESS = os.environ.get("UPLOAD_COMPRESS", "true").lower() in ("1", "true", "yes")
+# Seconds between uploader throughput log lines
+UPLOAD_STATS_INTERVAL = int(os.environ.get("UPLOAD_STATS_INTERVAL", 60))
+
+# Durable spool: when SPOOL_PATH is set, payloads are kept in this SQLite file until uploaded
+SPOOL_PATH = os.environ.get("SPOOL_PATH", "")
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", 100 * 1024 * 1024))
+# What to lose when the spool is full: "drop_oldest" or "drop_newest"
+SPOOL_DROP_POLICY = os.environ.get("SPOOL_DROP_POLICY", "drop_oldest")
+# Catch-up after an outage: replay the backlog in large batches at a bounded rate
+CATCHUP_BATCH_SIZE = int(os.environ.get("CATCHUP_BATCH_SIZE", 500))
+CATCHUP_MAX_RATE = float(os.environ.get("CATCHUP_MAX_RATE", 200))  # payloads per second
+# Longest wait between retries while uploads fail or the aggregator refuses payloads
+UPLOAD_MAX_BACKOFF = int(os.environ.get("UPLOAD_MAX_BACKOFF", 60))
+
+# Collector scheduling: seconds between collections per source, how long a collection may
+# take (defaults to its interval) and how many collections may run at once
+PC_INTERVAL = float(os.environ.get("PC_INTERVAL", 5))
+BITCOIN_INTERVAL = float(os.environ.get("BITCOIN_INTERVAL", 10))
+ETH_DOMINANCE_INTERVAL = float(os.environ.get("ETH_DOMINANCE_INTERVAL", 10))
+OPENSKY_INTERVAL = float(os.environ.get("OPENSKY_INTERVAL", 10))
+COLLECTOR_TIMEOUT = float(os.environ["COLLECTOR_TIMEOUT"]) if os.environ.get("COLLECTOR_TIMEOUT") else None
+COLLECTOR_MAX_CONCURRENCY = int(os.environ.get("COLLECTOR_MAX_CONCURRENCY", 8))
+
+# Command polling: seconds the aggregator may hold each poll open until a command arrives
+# (0 polls without waiting; only set it if the aggregator enables long polling, since each
+# held poll occupies a server worker), and the minimum seconds between polls that return nothing
+COMMAND_WAIT_SECONDS = float(os.environ.get("COMMAND_WAIT_SECONDS", 0))
+COMMAND_POLL_INTERVAL = float(os.environ.get("COMMAND_POLL_INTERVAL", 5))
@@ -1,7 +1,7 @@
 import logging
 import requests
-import time
 from registration import register_device
+from metrics_queue import build_payload
 from collector_agent.config import ETH_DOMINANCE_DEVICE_FRIENDLY_NAME, ETH_DOMINANCE_DEVICE_ROLE, ETH_DOMINANCE_GUID_FILE
 
 def collect_eth_dominance():
@@ -27,22 +27,8 @@ def collect_eth_dominance():
     if not device_guid:
         device_guid = "unregistered"
 
-    payload = {
-        "device_guid": device_guid,
-        "metrics": [
-            {"name": "Ethereum Dominance", "fields": {"percentage": eth_dominance}}
-        ]
-    }
+    payload = build_payload(device_guid, [
+        {"name": "Ethereum Dominance", "fields": {"percentage": eth_dominance}}
+    ])
     logging.info("Ethereum Dominance collector payload: %s", payload)
     return payload
-
-def run_eth_dominance_collector(metrics_queue, interval=10):
-    """
-    Runs the Ethereum Dominance collector agent which periodically fetches the metric
-    and puts the payload on the metrics_queue only if valid.
-    """
-    while True:
-        payload = collect_eth_dominance()
-        if payload is not None:
-            metrics_queue.put(payload)
-        time.sleep(interval)
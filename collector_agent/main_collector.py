@@ -1,13 +1,23 @@
+import asyncio
 import threading
 import logging
 import os
 import json
 from metrics_queue import create_metrics_queue
-from pc_collector import run_pc_collector, poll_commands
-from third_party_collector import run_third_party_collector
-from bitcoin_collector import run_bitcoin_collector
-from eth_dominance_collector import run_eth_dominance_collector
+from pc_collector import collect_local_metrics, poll_commands
+from third_party_collector import collect_opensky_metrics
+from bitcoin_collector import collect_bitcoin_metrics
+from eth_dominance_collector import collect_eth_dominance
+from scheduler import CollectorScheduler
 from uploader import upload_metrics
+from collector_agent.config import (
+    BITCOIN_INTERVAL,
+    COLLECTOR_MAX_CONCURRENCY,
+    COLLECTOR_TIMEOUT,
+    ETH_DOMINANCE_INTERVAL,
+    OPENSKY_INTERVAL,
+    PC_INTERVAL,
+)
 
 # Define a JSON formatter for machine-readable logging.
 class JsonFormatter(logging.Formatter):
@@ -43,24 +53,18 @@ def main():
     command_thread = threading.Thread(target=poll_commands, daemon=True)
     command_thread.start()
 
-    # Start thread for local PC metrics.
-    pc_thread = threading.Thread(target=run_pc_collector, args=(q, 5), daemon=True)
-    pc_thread.start()
-
-    # Start thread for Bitcoin metrics.
-    bitcoin_thread = threading.Thread(target=run_bitcoin_collector, args=(q, 10), daemon=True)
-    bitcoin_thread.start()
-    
-    # Start thread for Ethereum Dominance metrics.
-    eth_dominance_thread = threading.Thread(target=run_eth_dominance_collector, args=(q, 10), daemon=True)
-    eth_dominance_thread.start()
+    # Start the uploader thread.
+    uploader_thread = threading.Thread(target=upload_metrics, args=(q,), daemon=True)
+    uploader_thread.start()
 
+    # All collectors run from one scheduler on the main thread's event loop.
+    scheduler = CollectorScheduler(q, max_concurrency=COLLECTOR_MAX_CONCURRENCY)
+    scheduler.add("pc", collect_local_metrics, PC_INTERVAL, COLLECTOR_TIMEOUT)
+    scheduler.add("bitcoin", collect_bitcoin_metrics, BITCOIN_INTERVAL, COLLECTOR_TIMEOUT)
+    scheduler.add("eth_dominance", collect_eth_dominance, ETH_DOMINANCE_INTERVAL, COLLECTOR_TIMEOUT)
     #  OpenSky metrics (can get rate limited for day pretty quick).
-    third_party_thread = threading.Thread(target=run_third_party_collector, args=(q, 10), daemon=True)
-    third_party_thread.start()
-
-    # Start the uploader in the main thread.
-    upload_metrics(q)
+    scheduler.add("opensky", collect_opensky_metrics, OPENSKY_INTERVAL, COLLECTOR_TIMEOUT)
+    asyncio.run(scheduler.run())
 
 if __name__ == "__main__":
     main()
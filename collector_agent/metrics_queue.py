@@ -1,7 +1,44 @@
+import logging
 import queue
+import time
+import uuid
+from collector_agent.config import SPOOL_DROP_POLICY, SPOOL_MAX_BYTES, SPOOL_PATH
+
+class MetricsQueue(queue.Queue):
+    """
+    Thread-safe in-memory FIFO queue of upload payloads.
+    Payloads are lost if the collector stops or their upload fails; use the disk spool
+    (SPOOL_PATH) to keep them.
+    """
+    def ack(self, payloads):
+        """Mark payloads as uploaded."""
+        for _ in payloads:
+            self.task_done()
+
+    def requeue(self, payloads):
+        """An in-memory queue does not retry failed uploads; the payloads are dropped."""
+        logging.warning("Dropping %d payloads after a failed upload", len(payloads))
+        self.ack(payloads)
 
 def create_metrics_queue():
     """
-    Returns a thread-safe FIFO queue.
+    Returns the payload queue shared by the collectors and the uploader: a durable disk
+    spool when SPOOL_PATH is set, otherwise an in-memory queue.
+    """
+    if SPOOL_PATH:
+        from spool import SpoolQueue
+        return SpoolQueue(SPOOL_PATH, SPOOL_MAX_BYTES, SPOOL_DROP_POLICY)
+    return MetricsQueue()
+
+def build_payload(device_guid, metrics):
+    """
+    Build an upload payload stamped with its collection time (UTC epoch seconds) and a
+    unique idempotency key, so the aggregator stores it at the right time and only once,
+    however long it waits in the queue or however often it is retried.
     """
-    return queue.Queue()
+    return {
+        "device_guid": device_guid,
+        "metrics": metrics,
+        "timestamp": time.time(),
+        "idempotency_key": uuid.uuid4().hex
+    }
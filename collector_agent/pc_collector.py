@@ -3,8 +3,16 @@ import os
 import psutil
 import time
 from registration import register_device
-from aggregator_sdk.client import AggregatorAPI
-from collector_agent.config import LOCAL_DEVICE_FRIENDLY_NAME, LOCAL_DEVICE_ROLE, LOCAL_GUID_FILE
+from metrics_queue import build_payload
+from api_client import get_aggregator
+from aggregator_sdk.exceptions import CircuitOpenError
+from collector_agent.config import (
+    COMMAND_POLL_INTERVAL,
+    COMMAND_WAIT_SECONDS,
+    LOCAL_DEVICE_FRIENDLY_NAME,
+    LOCAL_DEVICE_ROLE,
+    LOCAL_GUID_FILE,
+)
 
 def collect_local_metrics():
     # Register (or retrieve) the GUID from a local file using environment-based settings.
@@ -15,36 +23,37 @@ def collect_local_metrics():
     process_count = len(psutil.pids())
     
     # Build the payload with a 'fields' dictionary for each metric.
-    metrics_payload = {
-        "device_guid": device_guid,
-        "metrics": [
-            {"name": "Memory Usage", "fields": {"percentage": mem_usage}},
-            {"name": "Process Count", "fields": {"count": process_count}}
-        ]
-    }
+    metrics_payload = build_payload(device_guid, [
+        {"name": "Memory Usage", "fields": {"percentage": mem_usage}},
+        {"name": "Process Count", "fields": {"count": process_count}}
+    ])
     return metrics_payload
 
 def poll_commands():
     """
     Polls the aggregator for pending commands for this device using the SDK.
+    Polls are spaced COMMAND_POLL_INTERVAL apart. With COMMAND_WAIT_SECONDS set, each poll is
+    a long poll: the aggregator holds it for up to that long and answers as soon as a command
+    is sent, so the next poll starts right away.
+    While the aggregator's circuit breaker is open, polling waits until it may close.
     """
-    aggregator = AggregatorAPI()
+    aggregator = get_aggregator()
     while True:
+        started = time.monotonic()
+        delay = COMMAND_POLL_INTERVAL
         try:
             # Get pending commands using the friendly name from config
-            commands = aggregator.get_commands(LOCAL_DEVICE_FRIENDLY_NAME)
+            commands = aggregator.get_commands(LOCAL_DEVICE_FRIENDLY_NAME, wait=COMMAND_WAIT_SECONDS)
+            delay = 0 if commands else COMMAND_POLL_INTERVAL - (time.monotonic() - started)
             for cmd in commands:
                 # Check for the specific command text (case-insensitive)
                 if cmd['command'].lower() == "open taskmanager":
                     logging.info("Executing Task Manager command")
                     # On Windows, this will open Task Manager.
                     os.system("start taskmgr")
+        except CircuitOpenError as e:
+            delay = max(delay, e.retry_after)
         except Exception as e:
             logging.error("Error polling commands: %s", e)
-        time.sleep(5)  # Poll every 5 seconds
-
-def run_pc_collector(metrics_queue, interval=5):
-    while True:
-        payload = collect_local_metrics()
-        metrics_queue.put(payload)
-        time.sleep(interval)
+        if delay > 0:
+            time.sleep(delay)
@@ -1,6 +1,9 @@
 import logging
 import os
-from aggregator_sdk.client import AggregatorAPI
+from api_client import get_aggregator
+
+# guid_file -> GUID, so collectors do not re-read the file on every cycle
+_guids = {}
 
 def register_device(role, friendly_name, guid_file):
     """
@@ -8,19 +11,24 @@ def register_device(role, friendly_name, guid_file):
     If the guid_file exists, returns the stored GUID.
     Otherwise, sends a registration request and stores the returned GUID.
     """
+    guid = _guids.get(guid_file)
+    if guid:
+        return guid
+
     if os.path.exists(guid_file):
         with open(guid_file, 'r') as f:
             guid = f.read().strip()
             if guid:
+                _guids[guid_file] = guid
                 return guid
 
-    aggregator = AggregatorAPI()
-    data = aggregator.register_device(role, friendly_name)
+    data = get_aggregator().register_device(role, friendly_name)
     if "device_guid" in data:
         guid = data["device_guid"]
         with open(guid_file, 'w') as f:
             f.write(guid)
+        _guids[guid_file] = guid
         return guid
     else:
-        logging.error("Error registering device:", data)
+        logging.error("Error registering device: %s", data)
         return None
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+class Source:
+    """
+    A metrics source run by the CollectorScheduler.
+
+    `collect` is a blocking callable returning a payload (or None to skip the tick). It is
+    called every `interval` seconds and abandoned after `timeout` seconds (default: the
+    interval).
+    """
+    def __init__(self, name, collect, interval, timeout=None):
+        self.name = name
+        self.collect = collect
+        self.interval = interval
+        self.timeout = timeout or interval
+        self.runs = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.errors = 0
+
+class CollectorScheduler:
+    """
+    Runs every source on fixed-rate ticks from a single event loop.
+
+    Tick N of a source is due at start + N * interval, so collection latency does not make
+    the schedule drift; ticks missed while the loop was busy are skipped rather than bunched
+    up. Collections run in a bounded thread pool, at most max_concurrency at once across all
+    sources and at most one at a time per source: a tick that arrives while the previous
+    collection (even one past its timeout) is still running is skipped.
+    """
+    def __init__(self, metrics_queue, max_concurrency=8):
+        self.metrics_queue = metrics_queue
+        self.max_concurrency = max_concurrency
+        self.sources = []
+
+    def add(self, name, collect, interval, timeout=None):
+        self.sources.append(Source(name, collect, interval, timeout))
+
+    async def run(self):
+        """Run every source until cancelled."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="collector") as executor:
+            await asyncio.gather(*(self._run_source(source, semaphore, executor) for source in self.sources))
+
+    async def _run_source(self, source, semaphore, executor):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tick = 0
+        running = None
+        while True:
+            if running is not None and not running.done():
+                source.skipped += 1
+                logging.warning("Collector %s is still running; skipping a tick", source.name)
+            else:
+                running = asyncio.ensure_future(self._collect(source, semaphore, executor))
+
+            # Sleep until the next tick on the fixed-rate grid, skipping any already missed.
+            tick += 1
+            now = loop.time()
+            missed = int((now - start) // source.interval) - tick + 1
+            if missed > 0:
+                source.skipped += missed
+                tick += missed
+            await asyncio.sleep(start + tick * source.interval - now)
+
+    async def _collect(self, source, semaphore, executor):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            future = loop.run_in_executor(executor, source.collect)
+            try:
+                payload = await asyncio.wait_for(asyncio.shield(future), source.timeout)
+                source.runs += 1
+                if payload is not None:
+                    self.metrics_queue.put(payload)
+            except asyncio.TimeoutError:
+                source.timeouts += 1
+                logging.error("Collector %s timed out after %ss; its result will be discarded",
+                              source.name, source.timeout)
+                # The thread cannot be interrupted; keep the source busy until it returns.
+                await asyncio.wait([future])
+            except Exception as e:
+                source.errors += 1
+                logging.error("Collector %s failed: %s", source.name, e)
@@ -0,0 +1,146 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+class SpoolQueue:
+    """
+    A bounded, durable FIFO of upload payloads kept in an append-only SQLite (WAL) file.
+
+    It offers the same interface as the in-memory MetricsQueue (put, get, qsize, empty, ack,
+    requeue), but a payload is only deleted once the uploader acks it, so payloads survive
+    aggregator outages and collector restarts. Payloads handed out by get() and then
+    requeued are returned again, in their original order. There must be a single consumer,
+    which acks or requeues every payload it got before getting more.
+
+    When the spool would exceed max_bytes, the drop policy decides what is lost:
+    "drop_oldest" deletes the oldest payloads not currently being uploaded, while
+    "drop_newest" discards the incoming payload. A payload larger than max_bytes on its own
+    is always discarded.
+    """
+    def __init__(self, path, max_bytes, drop_policy=DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown spool drop policy '{drop_policy}'")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._bytes, self._count = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM spool"
+        ).fetchone()
+        # Highest id handed out by get(); rows above it are pending
+        self._cursor = 0
+        # id(payload) -> (row id, size) for payloads handed out but not yet acked
+        self._in_flight = {}
+        if self._count:
+            logging.info("Spool %s holds %d payloads (%d bytes) from a previous run", path, self._count, self._bytes)
+
+    def put(self, payload, block=True, timeout=None):
+        data = json.dumps(payload, separators=(",", ":"))
+        size = len(data)
+        with self._lock:
+            if size > self.max_bytes:
+                # It could never fit, so it must not evict the backlog first
+                self.dropped += 1
+                logging.warning("Payload of %d bytes exceeds the spool size (%d bytes); dropping it", size, self.max_bytes)
+                return
+            if not self._make_room(size):
+                self.dropped += 1
+                logging.warning("Spool full (%d bytes); dropping newest payload", self._bytes)
+                return
+            self._conn.execute("INSERT INTO spool (payload, size) VALUES (?, ?)", (data, size))
+            self._bytes += size
+            self._count += 1
+            self._not_empty.notify()
+
+    def _make_room(self, size):
+        """Apply the drop policy until `size` more bytes fit. Returns False to drop the new payload."""
+        if self._bytes + size <= self.max_bytes:
+            return True
+        if self.drop_policy == DROP_NEWEST:
+            return False
+        in_flight = {row_id for row_id, _ in self._in_flight.values()}
+        doomed = []
+        remaining = self._bytes
+        for row_id, row_size in self._conn.execute("SELECT id, size FROM spool ORDER BY id"):
+            if remaining + size <= self.max_bytes:
+                break
+            if row_id in in_flight:
+                continue
+            doomed.append(row_id)
+            remaining -= row_size
+        if remaining + size > self.max_bytes:
+            # Payloads being uploaded cannot be evicted; keep the backlog rather than
+            # deleting it and still failing to fit
+            return False
+        if doomed:
+            self._delete(doomed)
+            self._bytes = remaining
+            self._count -= len(doomed)
+            self.dropped += len(doomed)
+            logging.warning("Spool full; dropped %d oldest payloads", len(doomed))
+        return True
+
+    def get(self, block=True, timeout=None):
+        with self._not_empty:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, payload, size FROM spool WHERE id > ? ORDER BY id LIMIT 1", (self._cursor,)
+                ).fetchone()
+                if row is not None:
+                    break
+                if not block or not self._not_empty.wait(timeout):
+                    raise queue.Empty
+            row_id, data, size = row
+            self._cursor = row_id
+            payload = json.loads(data)
+            self._in_flight[id(payload)] = (row_id, size)
+            return payload
+
+    def ack(self, payloads):
+        """Delete payloads that were uploaded (or permanently rejected)."""
+        with self._lock:
+            rows = [self._in_flight.pop(id(payload)) for payload in payloads if id(payload) in self._in_flight]
+            if rows:
+                self._delete([row_id for row_id, _ in rows])
+                self._bytes -= sum(size for _, size in rows)
+                self._count -= len(rows)
+
+    def requeue(self, payloads):
+        """Return payloads whose upload failed to the head of the spool."""
+        with self._lock:
+            rows = [self._in_flight.pop(id(payload)) for payload in payloads if id(payload) in self._in_flight]
+            if rows:
+                self._cursor = min(self._cursor, min(row_id for row_id, _ in rows) - 1)
+                self._not_empty.notify()
+
+    def _delete(self, row_ids):
+        # One statement per chunk, so each chunk is a single WAL commit
+        for start in range(0, len(row_ids), 500):
+            chunk = row_ids[start:start + 500]
+            self._conn.execute(f"DELETE FROM spool WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+    def qsize(self):
+        """Number of payloads waiting to be handed out."""
+        with self._lock:
+            return self._count - len(self._in_flight)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def size_bytes(self):
+        with self._lock:
+            return self._bytes
@@ -1,8 +1,8 @@
 import logging
 import requests
 import math
-import time
 from registration import register_device
+from metrics_queue import build_payload
 from collector_agent.config import OPENSKY_DEVICE_FRIENDLY_NAME, OPENSKY_DEVICE_ROLE, OPENSKY_GUID_FILE
 
 def haversine_distance(lat1, lon1, lat2, lon2):
@@ -66,17 +66,8 @@ def collect_opensky_metrics():
         device_guid = "unregistered"
 
     # Build the payload using fields for each metric.
-    payload = {
-        "device_guid": device_guid,
-        "metrics": [
-            {"name": "Plane Count Ireland", "fields": {"plane_count": plane_count}},
-            {"name": "Closest Plane Limerick", "fields": {"closest_distance": closest_distance, "callsign": closest_callsign}}
-        ]
-    }
+    payload = build_payload(device_guid, [
+        {"name": "Plane Count Ireland", "fields": {"plane_count": plane_count}},
+        {"name": "Closest Plane Limerick", "fields": {"closest_distance": closest_distance, "callsign": closest_callsign}}
+    ])
     return payload
-
-def run_third_party_collector(metrics_queue, interval=10):
-    while True:
-        payload = collect_opensky_metrics()
-        metrics_queue.put(payload)
-        time.sleep(interval)
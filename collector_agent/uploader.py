@@ -1,23 +1,144 @@
 import logging
+import queue
 import time
-from aggregator_sdk.client import AggregatorAPI
+from api_client import get_aggregator
+from aggregator_sdk.exceptions import CircuitOpenError
+from collector_agent.config import (
+    CATCHUP_BATCH_SIZE,
+    CATCHUP_MAX_RATE,
+    UPLOAD_BATCH_SIZE,
+    UPLOAD_COMPRESS,
+    UPLOAD_MAX_BACKOFF,
+    UPLOAD_MAX_WAIT_MS,
+    UPLOAD_STATS_INTERVAL,
+)
+
+class UploadStats:
+    """
+    Throughput counters for the uploader, logged every `interval` seconds:
+    payloads/sec, bytes on the wire and queue lag (age of the oldest payload in a batch).
+    """
+    def __init__(self, interval=UPLOAD_STATS_INTERVAL):
+        self.interval = interval
+        self._reset(time.monotonic())
+
+    def _reset(self, now):
+        self.window_start = now
+        self.payloads = 0
+        self.requests = 0
+        self.failed = 0
+        self.bytes_sent = 0
+        self.max_lag = 0.0
+
+    def record(self, payloads, bytes_sent, lag, ok):
+        self.payloads += payloads if ok else 0
+        self.failed += 0 if ok else payloads
+        self.requests += 1
+        self.bytes_sent += bytes_sent
+        self.max_lag = max(self.max_lag, lag)
+
+    def maybe_log(self, queue_depth):
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if elapsed < self.interval:
+            return
+        logging.info(
+            "Uploader stats: %.2f payloads/s, %d requests, %d bytes sent (%.0f bytes/s), "
+            "%d failed, max queue lag %.1fs, queue depth %d",
+            self.payloads / elapsed, self.requests, self.bytes_sent, self.bytes_sent / elapsed,
+            self.failed, self.max_lag, queue_depth
+        )
+        self._reset(now)
+
+def next_batch(metrics_queue, batch_size=UPLOAD_BATCH_SIZE, max_wait_ms=UPLOAD_MAX_WAIT_MS):
+    """
+    Block for the next payload, then keep draining the queue until batch_size payloads
+    are collected or max_wait_ms has passed since the first one arrived.
+    """
+    batch = [metrics_queue.get()]
+    deadline = time.monotonic() + max_wait_ms / 1000.0
+    while len(batch) < batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(metrics_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
 
 def upload_metrics(metrics_queue):
     """
-    Continuously takes items from the metrics_queue and posts them to the aggregator using the SDK.
-    Logs both the payload and the response (or error) so that the uploaded payload is visible.
+    Continuously takes batches of payloads from the metrics_queue and posts each batch to the
+    aggregator as a single (gzip-compressed) batch request using the SDK.
+
+    Uploaded payloads, and envelopes the aggregator rejects outright (which are logged), are
+    acked. The SDK retries failed requests with backoff; a request that still fails requeues
+    the batch, as do envelopes refused with 429, and uploads pause with exponential backoff
+    up to UPLOAD_MAX_BACKOFF seconds until a batch goes through. While the aggregator's
+    circuit is open the uploader waits for it. While a backlog of more than one batch is
+    queued (e.g. in the disk spool after an outage) the uploader is in catch-up mode: it
+    sends batches of CATCHUP_BATCH_SIZE, paced to at most CATCHUP_MAX_RATE payloads per second.
     """
-    aggregator = AggregatorAPI()
+    aggregator = get_aggregator()
+    stats = UploadStats()
+    backoff = 0
+    catching_up = False
     while True:
-        payload = metrics_queue.get()
+        backlog = metrics_queue.qsize()
+        if catching_up != (backlog > UPLOAD_BATCH_SIZE):
+            catching_up = not catching_up
+            logging.info("%s catch-up mode (%d payloads queued)", "Entering" if catching_up else "Leaving", backlog)
+
+        started = time.monotonic()
+        batch = next_batch(metrics_queue, CATCHUP_BATCH_SIZE if catching_up else UPLOAD_BATCH_SIZE)
+        oldest = min((p.get("timestamp") or time.time()) for p in batch)
+        lag = max(0.0, time.time() - oldest)
         try:
-            device_guid = payload.get("device_guid")
-            metrics = payload.get("metrics")
-            response = aggregator.post_metrics(device_guid, metrics)
-            logging.info("Successfully uploaded metrics. Payload: %s, Response: %s", payload, response)
+            response = aggregator.post_metrics_batch(batch, compress=UPLOAD_COMPRESS)
+        except CircuitOpenError as e:
+            metrics_queue.requeue(batch)
+            # A half-open circuit with a trial in flight reports retry_after 0
+            pause = max(1.0, e.retry_after or 0)
+            logging.warning("Aggregator unavailable; pausing uploads for %.1fs", pause)
+            time.sleep(pause)
+            continue
         except Exception as e:
-            logging.error("Error uploading metrics. Payload: %s, Error: %s", payload, e)
-        finally:
-            metrics_queue.task_done()
-        # Throttle the upload loop
-        time.sleep(1)
+            logging.error("Error uploading %d payloads. Error: %s", len(batch), e)
+            stats.record(len(batch), aggregator.last_request_bytes, lag, ok=False)
+            metrics_queue.requeue(batch)
+            backoff = min(max(1, backoff * 2), UPLOAD_MAX_BACKOFF)
+            time.sleep(backoff)
+            continue
+
+        # Envelopes refused because the aggregator's ingest queue was full are retried.
+        retry = []
+        for result in response.get("results", []):
+            if result.get("code") == 429:
+                retry.append(batch[result["index"]])
+            elif result.get("status") == "error":
+                logging.error("Aggregator rejected payload: %s, Error: %s",
+                              batch[result["index"]], result.get("error"))
+        if retry:
+            metrics_queue.requeue(retry)
+            retry_ids = {id(payload) for payload in retry}
+            batch = [payload for payload in batch if id(payload) not in retry_ids]
+        metrics_queue.ack(batch)
+        logging.debug("Uploaded %d payloads in %d bytes. Response: %s",
+                      len(batch), aggregator.last_request_bytes, response)
+        stats.record(len(batch), aggregator.last_request_bytes, lag, ok=True)
+        stats.maybe_log(metrics_queue.qsize())
+
+        if retry:
+            # The aggregator is overloaded; back off before resending what it refused.
+            backoff = min(max(1, backoff * 2), UPLOAD_MAX_BACKOFF)
+            logging.warning("Aggregator refused %d payloads; retrying in %ds", len(retry), backoff)
+            time.sleep(backoff)
+            continue
+        backoff = 0
+
+        if catching_up:
+            # Pace the replay so the backlog does not swamp the aggregator.
+            remaining = len(batch) / CATCHUP_MAX_RATE - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
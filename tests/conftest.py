@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aggregator.config import Config  # noqa: E402
+from aggregator.models import db  # noqa: E402
+from aggregator.api.routes import api_bp  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The API blueprint on a fresh SQLite database (the Dash app is not mounted)."""
+    app = Flask(__name__, template_folder=os.path.join(ROOT, 'aggregator', 'templates'))
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'aggregator.db'}"
+    db.init_app(app)
+    app.register_blueprint(api_bp)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def api_headers():
+    return {'X-API-Key': Config.API_KEY}
+
+
+@pytest.fixture
+def device_guid(client):
+    return client.post('/api/register', json={'role': 'PC', 'friendly_name': 'pc1'}).json['device_guid']
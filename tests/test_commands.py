@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from aggregator.models import db, Command
+from aggregator.services import command_service
+
+
+class DriverError(Exception):
+    def __init__(self, errno, msg):
+        super().__init__(errno, msg)
+        self.errno = errno
+
+
+def _fail_first_execute(monkeypatch, errno):
+    execute = db.session.execute
+    calls = []
+
+    def flaky_execute(statement, *args, **kwargs):
+        calls.append(statement)
+        if len(calls) == 1:
+            raise OperationalError(str(statement), {}, DriverError(errno, 'simulated'))
+        return execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db.session, 'execute', flaky_execute)
+    return calls
+
+
+def test_deadlocked_send_is_retried_once(app, device_guid, monkeypatch):
+    with app.app_context():
+        calls = _fail_first_execute(monkeypatch, command_service.MYSQL_DEADLOCK)
+
+        command_id, err = command_service.send_device_command('pc1', 'restart')
+
+        assert err is None and command_id is not None
+        assert len(calls) == 2
+        assert Command.query.count() == 1
+
+
+def test_deadlocked_broadcast_is_retried_once(app, device_guid, monkeypatch):
+    with app.app_context():
+        _fail_first_execute(monkeypatch, command_service.MYSQL_DEADLOCK)
+
+        assert command_service.broadcast_command('PC', 'restart') == (1, None)
+
+
+def test_other_operational_errors_are_raised(app, device_guid, monkeypatch):
+    with app.app_context():
+        calls = _fail_first_execute(monkeypatch, 2013)
+
+        with pytest.raises(OperationalError):
+            command_service.send_device_command('pc1', 'restart')
+        assert len(calls) == 1
+
+
+def test_long_poll_is_off_by_default(app, client, device_guid, monkeypatch):
+    waits = []
+    monkeypatch.setattr('aggregator.api.routes.wait_for_commands', lambda *args: waits.append(args))
+
+    response = client.get('/api/command/pc1?wait=30')
+
+    assert response.status_code == 200 and response.json == []
+    assert waits == []
+
+
+def test_long_poll_waits_up_to_the_configured_cap(app, client, device_guid, monkeypatch):
+    app.config['COMMAND_MAX_WAIT_SECONDS'] = 0.2
+    waits = []
+    monkeypatch.setattr(
+        'aggregator.api.routes.wait_for_commands', lambda name, wait, recheck: waits.append(wait) or ([], None)
+    )
+
+    client.get('/api/command/pc1?wait=30')
+
+    assert waits == [0.2]
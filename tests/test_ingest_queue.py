@@ -0,0 +1,42 @@
+import ast
+import os
+
+from aggregator.services.ingest_queue import WriteBehindQueue
+
+from conftest import ROOT
+
+
+def _metrics(device_guid):
+    return {'device_guid': device_guid, 'metrics': [{'name': 'Memory', 'fields': {'percentage': 40}}]}
+
+
+def test_full_queue_returns_429_with_retry_after(app, client, api_headers, device_guid):
+    # Not started, so nothing drains the queue
+    app.extensions['ingest_queue'] = WriteBehindQueue(app, maxsize=1, batch_size=1, flush_interval=2.0)
+
+    first = client.post('/api/metrics', json=_metrics(device_guid), headers=api_headers)
+    second = client.post('/api/metrics', json=_metrics(device_guid), headers=api_headers)
+
+    assert first.status_code == 202
+    assert second.status_code == 429
+    assert second.headers['Retry-After'] == '2'
+
+
+def test_full_queue_rejects_batch_with_429(app, client, api_headers, device_guid):
+    app.extensions['ingest_queue'] = WriteBehindQueue(app, maxsize=1, batch_size=1, flush_interval=1.0)
+    client.post('/api/metrics', json=_metrics(device_guid), headers=api_headers)
+
+    response = client.post('/api/metrics/batch', json=[_metrics(device_guid)], headers=api_headers)
+
+    assert response.status_code == 429
+    assert response.json['results'][0]['code'] == 429
+
+
+def test_app_imports_the_ingest_queue_the_routes_use():
+    # A top-level `services.ingest_queue` import would load a second module whose
+    # IngestQueueFull the routes do not catch.
+    with open(os.path.join(ROOT, 'aggregator', 'app.py')) as f:
+        tree = ast.parse(f.read())
+    modules = {node.module for node in ast.walk(tree) if isinstance(node, ast.ImportFrom)}
+    assert 'services.ingest_queue' not in modules
+    assert 'aggregator.services.ingest_queue' in modules
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from aggregator.models import LatestReading
+
+
+def _envelope(device_guid, timestamp):
+    return {
+        'device_guid': device_guid,
+        'timestamp': timestamp.isoformat() + 'Z',
+        'metrics': [{'name': 'Memory', 'fields': {'percentage': 40}}],
+    }
+
+
+def test_future_timestamp_is_rejected(app, client, api_headers, device_guid):
+    future = datetime.utcnow() + timedelta(seconds=app.config['MAX_CLOCK_SKEW_SECONDS'] + 60)
+
+    response = client.post('/api/metrics', json=_envelope(device_guid, future), headers=api_headers)
+
+    assert response.status_code == 400
+    assert 'future' in response.json['error']
+    with app.app_context():
+        assert LatestReading.query.count() == 0
+
+
+def test_timestamp_within_skew_is_accepted(client, api_headers, device_guid):
+    ahead = datetime.utcnow() + timedelta(seconds=30)
+
+    response = client.post('/api/metrics', json=_envelope(device_guid, ahead), headers=api_headers)
+
+    assert response.status_code == 200
+
+
+def test_batch_reports_future_timestamp_per_envelope(app, client, api_headers, device_guid):
+    now = datetime.utcnow()
+    future = now + timedelta(days=365)
+
+    response = client.post('/api/metrics/batch', headers=api_headers, json=[
+        _envelope(device_guid, now), _envelope(device_guid, future)
+    ])
+
+    assert response.status_code == 200
+    ok, rejected = response.json['results']
+    assert ok['status'] == 'ok'
+    assert (rejected['status'], rejected['code']) == ('error', 400)
+    assert 'future' in rejected['error']
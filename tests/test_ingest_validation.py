@@ -0,0 +1,35 @@
+import pytest
+
+from aggregator.models import Reading
+
+
+@pytest.mark.parametrize('metrics', [
+    {'name': 'Memory', 'fields': {'percentage': 40}},
+    ['Memory'],
+    [{'name': 'Memory', 'fields': [40]}],
+    [{'name': ['Memory'], 'fields': {'percentage': 40}}],
+    [{'name': 'M' * 51, 'fields': {'percentage': 40}}],
+    [{'name': 'Memory', 'fields': {'p' * 51: 40}}],
+])
+def test_malformed_metrics_are_rejected(client, api_headers, device_guid, metrics):
+    response = client.post('/api/metrics', headers=api_headers, json={'device_guid': device_guid, 'metrics': metrics})
+
+    assert response.status_code == 400
+    assert response.json['error']
+
+
+def test_batch_reports_malformed_envelopes_and_stores_the_rest(app, client, api_headers, device_guid):
+    good = {'device_guid': device_guid, 'metrics': [{'name': 'Memory', 'fields': {'percentage': 40}}]}
+
+    response = client.post('/api/metrics/batch', headers=api_headers, json=[
+        {'device_guid': device_guid, 'metrics': ['Memory']},
+        good,
+        {'device_guid': device_guid, 'metrics': [{'name': 'Disk', 'fields': 'full'}]},
+    ])
+
+    assert response.status_code == 200
+    assert [(r['status'], r.get('code')) for r in response.json['results']] == [
+        ('error', 400), ('ok', None), ('error', 400)
+    ]
+    with app.app_context():
+        assert Reading.query.count() == 1
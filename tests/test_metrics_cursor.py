@@ -0,0 +1,53 @@
+import types
+
+import pytest
+from sqlalchemy.orm import make_transient
+
+from aggregator.models import db, LatestReading
+from aggregator.services import snapshot_service
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(snapshot_service, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(snapshot_service, 'latest_horizon', snapshot_service.SettledHorizon(10))
+    # Recompute the snapshot on every call
+    monkeypatch.setattr(snapshot_service.latest_snapshot, 'ttl', 0)
+    return now
+
+
+def _changes(client, api_headers, since):
+    data = client.get(f'/api/metrics?since={since}', headers=api_headers).json
+    return sorted(item['metric'] for item in data['metrics']), data['cursor']
+
+
+def test_cursor_waits_for_late_commits(app, client, api_headers, device_guid, clock):
+    for name in ('A', 'B', 'C'):
+        client.post('/api/metrics', headers=api_headers, json={
+            'device_guid': device_guid, 'metrics': [{'name': name, 'fields': {'value': 1}}]
+        })
+    with app.app_context():
+        # B's reading (id 2) is still being committed when C's (id 3) is served
+        late = LatestReading.query.filter_by(reading_id=2).one()
+        db.session.expunge(late)
+        make_transient(late)
+        LatestReading.query.filter_by(reading_id=2).delete()
+        db.session.commit()
+
+    assert _changes(client, api_headers, 0) == (['A', 'C'], 0)
+
+    clock[0] += 5
+    with app.app_context():
+        db.session.add(late)
+        db.session.commit()
+    assert _changes(client, api_headers, 0) == (['A', 'B', 'C'], 0)
+
+    clock[0] += 6
+    # The id seen 11 seconds ago has settled
+    assert _changes(client, api_headers, 0) == (['A', 'B', 'C'], 3)
+    assert _changes(client, api_headers, 3) == ([], 3)
+
+
+def test_cursor_never_moves_back(client, api_headers, device_guid, clock):
+    assert _changes(client, api_headers, 42) == ([], 42)
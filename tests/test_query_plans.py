@@ -0,0 +1,74 @@
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from aggregator.models import db, Metric
+from aggregator.services.command_service import send_device_command
+from aggregator.services.history_service import get_metric_history
+from aggregator.storage import get_storage
+
+
+@contextmanager
+def _captured_statements():
+    """Collect the (statement, parameters) of every statement executed in the block."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+def _plans(statements, table):
+    """EXPLAIN QUERY PLAN (one line per step) of each captured statement reading `table`."""
+    reads_table = re.compile(rf'\b(FROM|JOIN) {table}\b')
+    connection = db.session.connection()
+    plans = []
+    for statement, parameters in statements:
+        if not reads_table.search(statement):
+            continue
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        plans.append((statement, [row[-1] for row in rows]))
+    return plans
+
+
+def test_history_and_latest_queries_use_the_reading_index(app, client, api_headers, device_guid):
+    for value in range(5):
+        client.post('/api/metrics', headers=api_headers, json={
+            'device_guid': device_guid, 'metrics': [{'name': 'Memory', 'fields': {'percentage': value}}]
+        })
+    with app.app_context():
+        metric_id = Metric.query.filter_by(name='Memory').one().id
+        cursor = get_metric_history(metric_id, page_size=2)['next_cursor']
+        with _captured_statements() as statements:
+            get_metric_history(metric_id, page=2, page_size=2)
+            get_metric_history(metric_id, page_size=2, before=cursor, include_total=False)
+            get_storage().latest_samples([metric_id])
+        plans = _plans(statements, 'reading')
+
+    assert len(plans) == 4
+    for statement, plan in plans:
+        assert any('ix_reading_metric_id_timestamp' in step for step in plan), (statement, plan)
+        assert 'SCAN reading' not in plan, (statement, plan)
+        if 'ORDER BY' in statement:
+            # Pages are read in index order rather than sorted
+            assert not any('TEMP B-TREE FOR ORDER BY' in step for step in plan), (statement, plan)
+
+
+def test_command_checks_use_the_command_index(app, client, api_headers, device_guid):
+    with app.app_context():
+        with _captured_statements() as statements:
+            send_device_command('pc1', 'restart')
+            send_device_command('pc1', 'restart')
+        plans = _plans(statements, 'command')
+
+    # Two INSERT ... SELECT statements (pending and cooldown anti-joins) and the rejection lookup
+    assert len(plans) == 3
+    for statement, plan in plans:
+        assert any('ix_command_device_id_executed_timestamp' in step for step in plan), (statement, plan)
+        assert not any(step.startswith('SCAN pending') or step.startswith('SCAN recent') for step in plan), (statement, plan)
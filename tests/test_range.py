@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from aggregator.config import Config
+from aggregator.models import Metric
+from aggregator.services import rollup_service
+from aggregator.services.range_service import get_metric_range
+
+
+@pytest.fixture(params=['eav', 'wide'])
+def storage(request, monkeypatch):
+    monkeypatch.setattr(Config, 'READING_STORAGE', request.param)
+    return request.param
+
+
+def _post(client, api_headers, device_guid, timestamp, fields):
+    response = client.post('/api/metrics', headers=api_headers, json={
+        'device_guid': device_guid,
+        'timestamp': timestamp.isoformat() + 'Z',
+        'metrics': [{'name': 'Plane', 'fields': fields}],
+    })
+    assert response.status_code == 200
+
+
+def test_last_skips_newer_readings_without_the_field(storage, app, client, api_headers, device_guid):
+    minute = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=5)
+    _post(client, api_headers, device_guid, minute, {'a': 1, 'b': 5})
+    _post(client, api_headers, device_guid, minute + timedelta(seconds=10), {'a': 2, 'b': 7})
+    # The newest reading of the minute has no value for b
+    _post(client, api_headers, device_guid, minute + timedelta(seconds=20), {'a': 3, 'b': None})
+
+    with app.app_context():
+        metric_id = Metric.query.one().id
+        start, end = minute, minute + timedelta(minutes=1)
+
+        # Twice, so the second call runs the cached compiled statements
+        get_metric_range(metric_id, start, end, 30, ('count', 'last'))
+        raw = get_metric_range(metric_id, start, end, 30, ('count', 'last'))
+        assert raw['source'] == 'raw'
+        assert raw['fields']['a'][0] == {'timestamp': raw['fields']['a'][0]['timestamp'], 'count': 3, 'last': 3.0}
+        assert raw['fields']['b'][0]['count'] == 2
+        assert raw['fields']['b'][0]['last'] == 7.0
+
+        rollup_service.run_rollups(settle_seconds=0)
+        rolled = get_metric_range(metric_id, start, end, 60, ('count', 'last'))
+        assert rolled['source'] == 'rollup_60s'
+        assert [point['last'] for point in rolled['fields']['b']] == [7.0]
+        assert [point['last'] for point in rolled['fields']['a']] == [3.0]
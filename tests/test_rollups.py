@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from aggregator.models import db, Reading, ReadingRollup, ReadingValue, RollupWatermark
+from aggregator.services import rollup_service
+
+T0 = datetime(2026, 10, 18, 12, 0, 0)
+
+
+def _post_reading(client, api_headers, device_guid, value):
+    response = client.post('/api/metrics', headers=api_headers, json={
+        'device_guid': device_guid, 'metrics': [{'name': 'Memory', 'fields': {'percentage': value}}]
+    })
+    assert response.status_code == 200
+
+
+def _rolled_up():
+    return db.session.query(func.sum(ReadingRollup.count)).filter(ReadingRollup.resolution == 60).scalar() or 0
+
+
+def _move_reading(old_id, new_id):
+    ReadingValue.query.filter_by(reading_id=old_id).update({'reading_id': new_id})
+    Reading.query.filter_by(id=old_id).update({'id': new_id})
+    db.session.commit()
+
+
+def _run_at(monkeypatch, now):
+    class FixedDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+    monkeypatch.setattr(rollup_service, 'datetime', FixedDatetime)
+    return rollup_service.run_rollups(settle_seconds=300)
+
+
+def test_late_committed_reading_below_the_horizon_is_rolled_up(app, client, api_headers, device_guid, monkeypatch):
+    with app.app_context():
+        for value in (10, 20, 30):
+            _post_reading(client, api_headers, device_guid, value)
+        # Reading 2 is still in an open ingest transaction: allocated, not yet visible
+        _move_reading(2, -2)
+
+        assert _run_at(monkeypatch, T0) == 0
+        _move_reading(-2, 2)
+        assert _run_at(monkeypatch, T0 + timedelta(seconds=60)) == 0
+
+        assert _run_at(monkeypatch, T0 + timedelta(seconds=301)) == 3
+        assert _rolled_up() == 3
+        assert rollup_service.get_watermark() == 3
+
+
+def test_readings_above_the_horizon_wait_for_it_to_settle(app, client, api_headers, device_guid, monkeypatch):
+    with app.app_context():
+        _post_reading(client, api_headers, device_guid, 10)
+        _run_at(monkeypatch, T0)
+        _post_reading(client, api_headers, device_guid, 20)
+
+        assert _run_at(monkeypatch, T0 + timedelta(seconds=301)) == 1
+        watermark = RollupWatermark.query.one()
+        assert (watermark.last_reading_id, watermark.horizon_reading_id) == (1, 2)
+
+        assert _run_at(monkeypatch, T0 + timedelta(seconds=602)) == 1
+        assert _rolled_up() == 2
+
+
+def test_zero_settle_rolls_up_everything_in_one_run(app, client, api_headers, device_guid):
+    with app.app_context():
+        for value in (10, 20):
+            _post_reading(client, api_headers, device_guid, value)
+
+        assert rollup_service.run_rollups(settle_seconds=0) == 2
+        assert rollup_service.get_watermark() == 2
@@ -0,0 +1,170 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from aggregator_sdk import retry
+from aggregator_sdk.client import AggregatorAPI
+from aggregator_sdk.exceptions import AggregatorAPIError, CircuitOpenError
+from aggregator_sdk.retry import CircuitBreaker, RetryPolicy
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker('GET /api/metrics', failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == 30
+
+    clock.now += 30
+    assert breaker.state == 'half-open'
+    breaker.before_call()
+    # Concurrent calls fail fast while the trial is running
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    breaker = CircuitBreaker('GET /api/metrics', failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.now += 30
+    breaker.before_call()
+
+
+class BrokenSession:
+    """A session whose responses fail in ways other than ConnectionError / Timeout."""
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ChunkedEncodingError('truncated'), KeyboardInterrupt()])
+def test_unexpected_error_during_trial_does_not_wedge_the_breaker(clock, error):
+    session = BrokenSession(error)
+    api = AggregatorAPI('http://aggregator.test', 'key', retry_policy=RetryPolicy.none(),
+                        failure_threshold=1, reset_timeout=30, session=session)
+    breaker = api.circuit_breaker('GET /api/schema')
+    _open(breaker)
+    clock.now += 30
+
+    with pytest.raises(type(error)):
+        api.get_schema()
+    assert breaker.state == 'open'
+
+    # Once the reset timeout passes again, a new trial is let through.
+    clock.now += 30
+    with pytest.raises(type(error)):
+        api.get_schema()
+    assert session.calls == 2
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {'Retry-After': '0'}
+        self.text = str(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class ScriptedSession:
+    """Returns (or raises) the scripted outcomes in order."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def _api(outcomes):
+    session = ScriptedSession(outcomes)
+    api = AggregatorAPI('http://aggregator.test', 'key', retry_policy=RetryPolicy(base_delay=0), session=session)
+    return api, session
+
+
+def _connect_refused():
+    reason = NewConnectionError(None, 'Connection refused')
+    return requests.ConnectionError(MaxRetryError(None, '/api/register', reason))
+
+
+def _connection_reset():
+    return requests.ConnectionError(ProtocolError('Connection aborted.', ConnectionResetError()))
+
+
+@pytest.mark.parametrize('status', [502, 504])
+def test_non_idempotent_call_is_not_retried_after_it_may_have_been_applied(status):
+    api, session = _api([FakeResponse(status), FakeResponse(201, {'device_guid': 'g'})])
+    with pytest.raises(AggregatorAPIError) as excinfo:
+        api.register_device('PC', 'pc1')
+    assert excinfo.value.status_code == status
+    assert session.calls == 1
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_non_idempotent_call_is_retried_when_the_server_refused_it(status):
+    api, session = _api([FakeResponse(status), FakeResponse(200, {'status': 'Command sent'})])
+    assert api.send_command('pc1', 'open taskmanager') == {'status': 'Command sent'}
+    assert session.calls == 2
+
+
+def test_non_idempotent_call_is_not_retried_after_a_connection_reset():
+    api, session = _api([_connection_reset(), FakeResponse(200, {'status': 'Command sent'})])
+    with pytest.raises(AggregatorAPIError):
+        api.send_command('pc1', 'open taskmanager')
+    assert session.calls == 1
+
+
+@pytest.mark.parametrize('error', [_connect_refused(), requests.ConnectTimeout('connect timed out')])
+def test_non_idempotent_call_is_retried_when_it_was_never_sent(error):
+    api, session = _api([error, FakeResponse(201, {'device_guid': 'g'})])
+    assert api.register_device('PC', 'pc1') == {'device_guid': 'g'}
+    assert session.calls == 2
+
+
+def test_idempotent_call_is_retried_after_a_connection_reset():
+    api, session = _api([_connection_reset(), FakeResponse(504), FakeResponse(200, [])])
+    assert api.get_schema() == []
+    assert session.calls == 3
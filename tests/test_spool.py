@@ -0,0 +1,59 @@
+import os
+import sys
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'collector_agent'))
+
+from spool import DROP_NEWEST, DROP_OLDEST, SpoolQueue  # noqa: E402
+
+
+def _payload(size):
+    # Serialized as {"d":"xxx..."}: 8 bytes of JSON around the padding
+    return {'d': 'x' * (size - 8)}
+
+
+def test_oversized_payload_does_not_evict_the_backlog(tmp_path):
+    spool = SpoolQueue(str(tmp_path / 'spool.db'), max_bytes=200, drop_policy=DROP_OLDEST)
+    for _ in range(5):
+        spool.put(_payload(30))
+
+    spool.put(_payload(500))
+
+    assert spool.qsize() == 5
+    assert spool.dropped == 1
+    assert spool.size_bytes() == 150
+
+
+def test_drop_oldest_evicts_just_enough(tmp_path):
+    spool = SpoolQueue(str(tmp_path / 'spool.db'), max_bytes=100, drop_policy=DROP_OLDEST)
+    for size in (40, 30, 30):
+        spool.put(_payload(size))
+
+    spool.put(_payload(50))
+
+    assert [len(spool.get()['d']) + 8 for _ in range(spool.qsize())] == [30, 50]
+    assert spool.dropped == 2
+
+
+def test_in_flight_payloads_are_kept_and_new_one_dropped(tmp_path):
+    spool = SpoolQueue(str(tmp_path / 'spool.db'), max_bytes=100, drop_policy=DROP_OLDEST)
+    spool.put(_payload(60))
+    spool.put(_payload(30))
+    spool.get()  # the 60-byte payload is being uploaded
+
+    spool.put(_payload(50))
+
+    # Evicting the 30-byte payload would not make room, so it is kept
+    assert spool.qsize() == 1
+    assert spool.dropped == 1
+
+
+def test_drop_newest_keeps_the_backlog(tmp_path):
+    spool = SpoolQueue(str(tmp_path / 'spool.db'), max_bytes=100, drop_policy=DROP_NEWEST)
+    spool.put(_payload(60))
+
+    spool.put(_payload(60))
+
+    assert spool.qsize() == 1
+    assert spool.dropped == 1
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from aggregator.models import db, Metric, MetricField
+from aggregator.services.definition_cache import FieldRef
+from aggregator.storage import Sample, get_storage
+
+
+@pytest.fixture
+def field(app, device_guid):
+    with app.app_context():
+        metric = Metric(device_id=1, name='Memory')
+        db.session.add(metric)
+        db.session.flush()
+        metric_field = MetricField(metric_id=metric.id, field_index=1, field_name='percentage', field_type='numeric')
+        db.session.add(metric_field)
+        db.session.commit()
+        return metric.id, FieldRef(metric_field.id, 1, 'numeric')
+
+
+@pytest.mark.parametrize('engine', ['eav', 'wide'])
+def test_insert_samples_returns_ids_in_sample_order(app, field, engine):
+    metric_id, field_ref = field
+    start = datetime(2026, 10, 18, 12, 0, 0)
+    samples = [
+        Sample(metric_id, start + timedelta(seconds=i), [(field_ref, None, float(i))]) for i in range(300)
+    ]
+    storage = get_storage(engine)
+    with app.app_context():
+        reading_ids, values = storage.insert_samples(samples)
+        db.session.commit()
+
+        assert len(reading_ids) == len(set(reading_ids)) == 300
+        assert values == 300
+        rows = dict(storage.history_query(metric_id).all())
+        assert [rows[reading_id] for reading_id in reading_ids] == [s.timestamp for s in samples]
+        stored = storage.load_values(reading_ids)
+        assert [stored[reading_id][0][2] for reading_id in reading_ids] == list(range(300))
@@ -0,0 +1,42 @@
+import json
+
+from aggregator.services.stream_broker import metrics_broker
+
+
+def test_ingested_readings_are_published_to_matching_subscribers(client, api_headers, device_guid):
+    everything = metrics_broker.subscribe()
+    disk_only = metrics_broker.subscribe(metrics={'Disk'})
+    try:
+        client.post('/api/metrics', headers=api_headers, json={'device_guid': device_guid, 'metrics': [
+            {'name': 'Memory', 'fields': {'percentage': 40}},
+            {'name': 'Disk', 'fields': {'free': 10}},
+        ]})
+        frames = everything.get(timeout=0)
+        disk_frames = disk_only.get(timeout=0)
+    finally:
+        metrics_broker.unsubscribe(everything)
+        metrics_broker.unsubscribe(disk_only)
+
+    events = [json.loads(frame.split('data: ', 1)[1]) for frame in frames]
+    assert [(e['device'], e['metric'], e['fields']) for e in events] == [
+        ('pc1', 'Memory', {'percentage': 40}),
+        ('pc1', 'Disk', {'free': 10}),
+    ]
+    assert frames[0].startswith(f"id: {events[0]['reading_id']}\n")
+    assert len(disk_frames) == 1 and '"Disk"' in disk_frames[0]
+
+
+def test_slow_subscriber_is_dropped():
+    subscription = metrics_broker.subscribe()
+    subscription.maxsize = 1
+    event = {'device': 'd', 'metric': 'm', 'metric_id': 1, 'reading_id': 1, 'fields': {}, 'timestamp': 't'}
+    metrics_broker.publish([event, dict(event, reading_id=2)])
+    assert subscription.dropped
+    assert metrics_broker.stats()['subscribers'] == 0
+
+
+def test_stream_is_refused_beyond_the_subscriber_limit(client, monkeypatch):
+    monkeypatch.setattr(metrics_broker, 'max_subscribers', 0)
+    response = client.get('/api/stream/metrics')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+# The collector agent imports its sibling modules as top-level modules
+sys.path.insert(0, os.path.join(ROOT, 'collector_agent'))
+
+import uploader  # noqa: E402
+from aggregator_sdk.exceptions import AggregatorAPIError  # noqa: E402
+
+
+class StopUploading(Exception):
+    pass
+
+
+class FakeQueue:
+    """Hands out the same payloads forever, recording acks and requeues."""
+
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.acked = []
+        self.requeued = []
+
+    def get(self, block=True, timeout=None):
+        return self.payloads[0]
+
+    def qsize(self):
+        return 1
+
+    def ack(self, payloads):
+        self.acked.extend(payloads)
+
+    def requeue(self, payloads):
+        self.requeued.extend(payloads)
+
+
+class FakeAggregator:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.last_request_bytes = 0
+
+    def post_metrics_batch(self, envelopes, compress=False):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _run(monkeypatch, responses, sleeps_allowed):
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) >= sleeps_allowed:
+            raise StopUploading
+
+    metrics_queue = FakeQueue([{'device_guid': 'g', 'metrics': [], 'timestamp': 0}])
+    monkeypatch.setattr(uploader, 'get_aggregator', lambda: FakeAggregator(responses))
+    monkeypatch.setattr(uploader, 'UPLOAD_BATCH_SIZE', 1)
+    monkeypatch.setattr(uploader, 'UPLOAD_MAX_WAIT_MS', 0)
+    monkeypatch.setattr(uploader, 'UPLOAD_MAX_BACKOFF', 8)
+    monkeypatch.setattr(uploader.time, 'sleep', fake_sleep)
+    with pytest.raises((StopUploading, IndexError)):
+        uploader.upload_metrics(metrics_queue)
+    return sleeps, metrics_queue
+
+
+def test_failed_uploads_back_off_exponentially_up_to_the_cap(monkeypatch):
+    error = AggregatorAPIError("Error 400: bad request", status_code=400)
+    sleeps, metrics_queue = _run(monkeypatch, [error] * 6, sleeps_allowed=6)
+    assert sleeps == [1, 2, 4, 8, 8, 8]
+    assert len(metrics_queue.requeued) == 6
+
+
+def test_refused_envelopes_back_off_and_success_resets(monkeypatch):
+    refused = {'results': [{'index': 0, 'status': 'error', 'code': 429}]}
+    ok = {'results': [{'index': 0, 'status': 'ok'}]}
+    error = AggregatorAPIError("Error 500", status_code=500)
+    # Two refusals, a success, then a failure that starts the backoff over
+    sleeps, metrics_queue = _run(monkeypatch, [refused, refused, ok, error], sleeps_allowed=3)
+    assert sleeps == [1, 2, 1]
+    assert len(metrics_queue.acked) == 1
+    assert len(metrics_queue.requeued) == 3